@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from gpclib.cache import GPCCache, GPCSubMemo
+from gpclib.decode import map_file
+from gpclib.passes import GPCPassManager
+from gpclib.render import kinds, output
+
+
+def find_inputs(paths):
+    # returns (input path, output name) pairs
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.gbc'):
+                        full = os.path.join(root, name)
+                        inputs.append((full, os.path.relpath(full, path)))
+        else:
+            matches = sorted(glob.glob(path)) or [path]
+            for full in matches:
+                inputs.append((full, os.path.basename(full)))
+    return inputs
+
+def output_path(outdir, name, kind):
+    base, ext = os.path.splitext(name)
+    return os.path.join(outdir, base + kinds[kind][2])
+
+# subs already structured by this process
+memo = None
+
+def process(job):
+    global memo
+    path, out, kind, cache, plans, stats, jobs = job
+    if memo is None:
+        memo = GPCSubMemo(plans)
+    manager = GPCPassManager(stats=stats, jobs=jobs) if stats or jobs > 1 else None
+    start = time.time()
+    status = 'ok'
+    message = ''
+    tmp = None
+    try:
+        error, lines = output(map_file(path), kind, cache, memo, manager)
+        if error is not None:
+            status = 'error'
+            message = error
+
+        # write to a temporary file first so a crash never leaves half an output
+        if not os.path.isdir(os.path.dirname(out)):
+            try:
+                os.makedirs(os.path.dirname(out))
+            except OSError:
+                pass
+        tmp = '{0}.{1}.tmp'.format(out, os.getpid())
+        with open(tmp, 'wb') as f:
+            for line in lines:
+                f.write(line + '\n')
+        os.rename(tmp, out)
+    except Exception as e:
+        status = 'failed'
+        message = traceback.format_exception_only(type(e), e)[-1].strip()
+        if tmp and os.path.exists(tmp):
+            os.unlink(tmp)
+    return path, status, time.time() - start, message, manager and manager.report()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='decompile many gbc files at once')
+    parser.add_argument('paths', nargs='+', help='gbc files, directories or glob patterns')
+    parser.add_argument('-o', '--output', required=True, help='output directory')
+    parser.add_argument('-k', '--kind', choices=sorted(kinds), default='c', help='output kind (default c)')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='worker processes (default one per cpu)')
+    parser.add_argument('--no-cache', action='store_true', help='do not read or write the decode cache')
+    parser.add_argument('--cache-subs', action='store_true', help='also keep the structure of every sub in the cache for later runs')
+    parser.add_argument('--stats', nargs='?', const='', metavar='FILE', help='time every pass over all inputs, as a table on stderr or with --stats=FILE as a json report')
+    args = parser.parse_args()
+    stats = args.stats is not None
+    cache = None if args.no_cache or stats else GPCCache()
+    plans = GPCCache() if args.cache_subs else None
+
+    inputs = find_inputs(args.paths)
+    outputs = {}
+    for path, name in inputs:
+        out = output_path(args.output, name, args.kind)
+        if out in outputs:
+            parser.error('{0} and {1} both write {2}'.format(outputs[out], path, out))
+        outputs[out] = path
+
+    # one file gets the workers for its functions instead, pool workers
+    # cannot have workers of their own
+    within = args.jobs if len(inputs) == 1 else 1
+
+    # largest files first so one big file does not finish the batch alone
+    jobs = []
+    for path, name in inputs:
+        size = os.path.getsize(path) if os.path.isfile(path) else 0
+        jobs.append((size, (path, output_path(args.output, name, args.kind), args.kind, cache, plans, stats, within)))
+    jobs = [job for size, job in sorted(jobs, key=lambda j: -j[0])]
+
+    if args.jobs > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(args.jobs)
+        results = pool.imap_unordered(process, jobs)
+    else:
+        pool = None
+        results = (process(job) for job in jobs)
+
+    counts = {'ok': 0, 'error': 0, 'failed': 0}
+    total = GPCPassManager(stats=True)
+    start = time.time()
+    for path, status, elapsed, message, report in results:
+        counts[status] += 1
+        if report:
+            total.merge(report)
+        line = '{0:<6} {1:8.3f}s  {2}'.format(status, elapsed, path)
+        if message:
+            line += ': ' + message
+        print line
+        sys.stdout.flush()
+    if pool:
+        pool.close()
+        pool.join()
+
+    print '{0} ok, {1} error, {2} failed in {3:.3f}s'.format(counts['ok'], counts['error'], counts['failed'], time.time() - start)
+    if stats:
+        total.write(args.stats)
+    sys.exit(1 if counts['failed'] else 0)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from gpclib.passes import GPCPassManager
+from gpclib.render import kinds, output
+from gpclib.synth import GPCGenerator, max_size
+
+# the CLIs and the output kind each one renders
+scripts = (('gpcdump.py', 'asm'), ('gpctoc.py', 'c'), ('gpctoblocks.py', 'blocks'), ('gpctofgrp.py', 'fgrp'), ('gpcexport.py', 'jsonl'))
+
+# modules whose import is timed, the scripts imported as modules only run
+# their imports
+imports = ('gpclib.client', 'gpclib.opcodes', 'gpclib.decode', 'gpclib.render') + tuple(
+    os.path.splitext(script)[0] for script, kind in scripts)
+
+def generate(seed, size):
+    # combos and a data segment on all but the smallest images
+    combos = min(4, size // 2000)
+    data = 16 if size >= 1000 else 0
+    return GPCGenerator(seed, size, combos, data).generate()
+
+def time_passes(data, kind, repeat):
+    # best time of every pass and the renderer over repeat decodes
+    best = {}
+    for i in range(repeat):
+        manager = GPCPassManager(stats=True)
+        error, lines = output(data, kind, manager=manager)
+        for line in lines:
+            pass
+        for entry in manager.report()['passes']:
+            if entry['calls']:
+                best[entry['name']] = min(best.get(entry['name'], entry['time']), entry['time'])
+    return best
+
+def time_script(script, path, repeat):
+    # best wall time of the whole process, start up included
+    best = None
+    base = os.path.dirname(os.path.abspath(__file__))
+    with open(os.devnull, 'wb') as null:
+        for i in range(repeat):
+            start = time.time()
+            subprocess.call([sys.executable, os.path.join(base, script), '--no-cache', path], stdout=null, stderr=null)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def time_import(module, repeat):
+    # best time to import module in a fresh interpreter, its own start up
+    # not included
+    best = None
+    base = os.path.dirname(os.path.abspath(__file__))
+    code = 'import sys, time; start = time.time(); import {0}; sys.stdout.write(repr(time.time() - start))'.format(module)
+    for i in range(repeat):
+        elapsed = float(subprocess.check_output([sys.executable, '-c', code], cwd=base))
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def exponent(results, key):
+    # how time grows with size between the smallest and largest image,
+    # 1 is linear
+    points = [(r['bytes'], r['times'][key]) for r in results if r['times'].get(key)]
+    if len(points) < 2:
+        return None
+    (b0, t0), (b1, t1) = min(points), max(points)
+    if b0 == b1 or t0 <= 0:
+        return None
+    return math.log(t1 / t0) / math.log(float(b1) / b0)
+
+def exponents(results, prefix=''):
+    keys = set()
+    for result in results:
+        keys.update(result['times'])
+    return dict((prefix + key, exponent(results, key)) for key in keys)
+
+def largest(results, prefix=''):
+    # times on the biggest image
+    if not results:
+        return {}
+    return dict((prefix + key, t) for key, t in max(results, key=lambda r: r['bytes'])['times'].items())
+
+def shape_results(results):
+    # shape results grouped by shape, keys are prefixed with the shape name
+    shapes = {}
+    for result in results:
+        shapes.setdefault(result['shape'], []).append(result)
+    return [(shape + '/', shapes[shape]) for shape in sorted(shapes)]
+
+def compare(current, baseline, tolerance, floor):
+    # lines describing every time or scaling exponent that got worse
+    lines = []
+    for name, ident in (('results', lambda r: r['size']), ('shapes', lambda r: (r['shape'], r['count']))):
+        old = dict((ident(r), r) for r in baseline.get(name, ()))
+        for result in current.get(name, ()):
+            before = old.get(ident(result))
+            if before is None:
+                continue
+            for key, elapsed in sorted(result['times'].items()):
+                was = before['times'].get(key)
+                if was is None or was < floor:
+                    continue
+                if elapsed > was * (1 + tolerance):
+                    label = result['size'] if name == 'results' else '{0}/{1}'.format(result['shape'], result['count'])
+                    lines.append('{0:>12} {1:<24} {2:9.4f}s was {3:9.4f}s ({4:+.0%})'.format(
+                        label, key, elapsed, was, elapsed / was - 1))
+
+    old = baseline.get('imports', {})
+    for module, elapsed in sorted(current.get('imports', {}).items()):
+        was = old.get(module)
+        if was is not None and was >= floor and elapsed > was * (1 + tolerance):
+            lines.append('{0:>12} {1:<24} {2:9.4f}s was {3:9.4f}s ({4:+.0%})'.format(
+                'import', module, elapsed, was, elapsed / was - 1))
+
+    # exponents of measurements too short to time are noise
+    biggest = largest(baseline['results'])
+    for prefix, results in shape_results(baseline.get('shapes', ())):
+        biggest.update(largest(results, prefix))
+    for key in sorted(current['exponents']):
+        now, was = current['exponents'][key], baseline.get('exponents', {}).get(key)
+        if now is None or was is None or biggest.get(key, 0.0) < floor:
+            continue
+        if now > was + tolerance:
+            lines.append('{0:>12} {1:<24} scales as n^{2:.2f}, was n^{3:.2f}'.format('all', key, now, was))
+    return lines
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time every decoder pass and CLI over synthetic images of growing size')
+    parser.add_argument('-s', '--sizes', default='300,1000,4000,16000,{0}'.format(max_size), help='image sizes in bytes, comma separated')
+    parser.add_argument('--seed', type=int, default=0, help='generator seed (default 0)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per measurement, the best one counts (default 3)')
+    parser.add_argument('-k', '--kinds', default=','.join(sorted(kinds)), help='output kinds to time in process, comma separated')
+    parser.add_argument('--no-scripts', action='store_true', help='do not time the CLIs')
+    parser.add_argument('--no-imports', action='store_true', help='do not time importing the library and CLIs')
+    parser.add_argument('--shapes', default='elseif,if,while', help='also time the full decode of main as one else if chain, nested ifs or nested whiles, comma separated or empty for none')
+    parser.add_argument('--counts', default='10,100,1000', help='arms or nesting levels of every shape, comma separated')
+    parser.add_argument('-o', '--output', help='write the results here as json')
+    parser.add_argument('-b', '--baseline', help='compare against results saved earlier')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline (default 0.25)')
+    parser.add_argument('--floor', type=float, default=0.005, help='ignore baseline times below this many seconds (default 0.005)')
+    parser.add_argument('--images', help='also keep the generated images in this directory')
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(',')]
+    selected = args.kinds.split(',')
+    for kind in selected:
+        if kind not in kinds:
+            parser.error('unknown kind {0}'.format(kind))
+
+    current = {
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': [],
+        'shapes': [],
+        'imports': {},
+    }
+    if not args.no_imports:
+        for module in imports:
+            current['imports'][module] = time_import(module, args.repeat)
+        print 'imports  {0}'.format('  '.join('{0}={1:.4f}s'.format(m, current['imports'][m]) for m in imports))
+        sys.stdout.flush()
+
+    for size in sizes:
+        data = generate(args.seed, size)
+        result = {'size': size, 'bytes': len(data), 'times': {}}
+        for kind in selected:
+            for name, elapsed in time_passes(data, kind, args.repeat).items():
+                result['times']['{0}:{1}'.format(kind, name)] = elapsed
+
+        if not args.no_scripts or args.images:
+            if args.images:
+                if not os.path.isdir(args.images):
+                    os.makedirs(args.images)
+                path = os.path.join(args.images, 'synth_{0}_{1}.gbc'.format(args.seed, size))
+            else:
+                fd, path = tempfile.mkstemp(suffix='.gbc')
+                os.close(fd)
+            with open(path, 'wb') as f:
+                f.write(data)
+            if not args.no_scripts:
+                for script, kind in scripts:
+                    result['times']['script:' + script] = time_script(script, path, args.repeat)
+            if not args.images:
+                os.unlink(path)
+
+        current['results'].append(result)
+        print '{0:>6} bytes  {1}'.format(len(data), '  '.join('{0}={1:.4f}s'.format(k, v)
+            for k, v in sorted(result['times'].items()) if k.startswith('script:') or k.startswith('c:render')))
+        sys.stdout.flush()
+
+    for shape in [s for s in args.shapes.split(',') if s]:
+        for count in [int(c) for c in args.counts.split(',')]:
+            data = GPCGenerator(args.seed).shape(shape, count)
+            result = {'shape': shape, 'count': count, 'bytes': len(data), 'times': {}}
+            # asm runs the same passes as the structured kinds and renders flat
+            for name, elapsed in time_passes(data, 'asm', args.repeat).items():
+                result['times']['asm:' + name] = elapsed
+            current['shapes'].append(result)
+            print '{0:>6} {1:<6} x{2:<5} resolve={3:.4f}s'.format(len(data), shape, count, result['times'].get('asm:resolve', 0.0))
+            sys.stdout.flush()
+
+    current['exponents'] = exponents(current['results'])
+    biggest = largest(current['results'])
+    for prefix, results in shape_results(current['shapes']):
+        current['exponents'].update(exponents(results, prefix))
+        biggest.update(largest(results, prefix))
+
+    print
+    print '{0:<30} {1:>10} {2:>9}'.format('measurement', 'largest', 'scaling')
+    for key in sorted(current['exponents']):
+        scaling = current['exponents'][key]
+        print '{0:<30} {1:>9.4f}s {2:>9}'.format(key, biggest.get(key, 0.0),
+            'n^{0:.2f}'.format(scaling) if scaling is not None else '-')
+
+    if args.output:
+        with open(args.output, 'wb') as f:
+            json.dump(current, f, indent=1, sort_keys=True)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline, 'rb') as f:
+            baseline = json.load(f)
+        worse = compare(current, baseline, args.tolerance, args.floor)
+        print
+        if worse:
+            print 'slower than {0}:'.format(args.baseline)
+            for line in worse:
+                print line
+            sys.exit(1)
+        print 'no slower than {0}'.format(args.baseline)
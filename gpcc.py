@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import os
+import socket
+import sys
+from gpclib.client import GPCClient
+
+# the script each kind comes from, run instead when no daemon is listening
+scripts = {
+    'asm': 'gpcdump.py',
+    'c': 'gpctoc.py',
+    'blocks': 'gpctoblocks.py',
+    'fgrp': 'gpctofgrp.py',
+    'jsonl': 'gpcexport.py',
+}
+
+
+if __name__ == '__main__':
+    options = [a for a in sys.argv[1:] if a == '--no-cache' or a.split('=')[0] in ('--stats', '--kind', '--jobs')]
+    args = [a for a in sys.argv[1:] if a not in options]
+    # linked as one of the scripts it does that script's kind
+    name = os.path.splitext(os.path.basename(sys.argv[0]))[0] + '.py'
+    kind = dict((v, k) for k, v in scripts.items()).get(name, 'c')
+    kinds = [a.partition('=')[2] for a in options if a.split('=')[0] == '--kind']
+    kind = kinds[-1] if kinds else kind
+    jobs = [a.partition('=')[2] for a in options if a.split('=')[0] == '--jobs']
+    if len(args) != 1 or kind not in scripts or [j for j in jobs if not j.isdigit()]:
+        print 'usage: {0} [--kind=asm|c|blocks|fgrp|jsonl] [--no-cache] [--stats[=report.json]] [--jobs=N] file.gbc'.format(sys.argv[0])
+        print '--jobs is for gpctoc.py when no daemon is listening, a daemon uses its own workers (gpcd.py --jobs)'
+        sys.exit(-1)
+
+    stats = [a.partition('=')[2] for a in options if a.split('=')[0] == '--stats']
+    try:
+        client = GPCClient()
+    except socket.error:
+        # no daemon, do it here the slow way
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), scripts[kind])
+        rest = [a for a in options if a.split('=')[0] != '--kind' and (kind == 'c' or a.split('=')[0] != '--jobs')]
+        os.execv(sys.executable, [sys.executable, script] + rest + args)
+
+    with open(args[0], 'rb') as f:
+        data = f.read()
+    try:
+        error, lines, report = client.render(data, kind, '--no-cache' not in options, bool(stats))
+    except ValueError as e:
+        sys.stderr.write('{0}\n'.format(e))
+        sys.exit(-1)
+    for line in lines:
+        print line
+
+    if stats:
+        from gpclib.passes import GPCPassManager
+        manager = GPCPassManager(stats=True)
+        manager.merge(report)
+        manager.write(stats[-1])
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import argparse
+import multiprocessing
+import signal
+import sys
+from gpclib.client import default_path
+from gpclib.daemon import GPCDaemon
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='keep the decompiler warm for gpcc.py and editors')
+    parser.add_argument('-s', '--socket', default=default_path(), help='unix socket to listen on (default $GPCDIS_SOCKET, or gpcdis-UID.sock in $XDG_RUNTIME_DIR or /tmp)')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='worker processes (default one per cpu)')
+    parser.add_argument('--memory', type=int, default=64, metavar='MB', help='outputs kept in memory for repeated requests (default 64)')
+    parser.add_argument('--no-cache', action='store_true', help='do not read or write the decode cache on disk')
+    parser.add_argument('--stats', nargs='?', const='', metavar='FILE', help='time every pass of every request, as a table on stderr or with --stats=FILE as a json report when the daemon stops')
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    try:
+        server = GPCDaemon(args.socket, args.jobs, args.memory * 1024 * 1024, not args.no_cache, args.stats is not None)
+    except (ValueError, OSError) as e:
+        sys.stderr.write('{0}\n'.format(e))
+        sys.exit(-1)
+
+    # a terminate removes the socket like an interrupt does
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if server.stats is not None:
+            server.stats.write(args.stats)
@@ -1,30 +1,44 @@
 #!/usr/bin/env python
 
 import sys
-from gpclib.decode import GPCDecoder
+from gpclib.decode import GPCDecoder, is_container, map_file
+from gpclib.passes import GPCPassManager
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print 'usage: {0} file.gbc'.format(sys.argv[0])
+    options = [a for a in sys.argv[1:] if a == '--no-cache' or a.split('=')[0] == '--stats']
+    args = [a for a in sys.argv[1:] if a not in options]
+    if len(args) != 1:
+        print 'usage: {0} [--no-cache] [--stats[=report.json]] file.gbc'.format(sys.argv[0])
         sys.exit(-1)
 
-    # read the entire input
-    data = open(sys.argv[1], 'rb').read()
-
-    decoder = GPCDecoder(data)
-    
-    # decode the entire input
-    try:
-        decoder.full_decode()
-    except ValueError as e:
-        print e
-
-    # print all the opcodes
-    sorted_ops = sorted(decoder.operations.items(), key=lambda i: i[0])
-    for idx, (addr, op) in enumerate(sorted_ops):
-        if op._sub:
-            print '{0:0>4X} {1}:'.format(addr, op._sub)
-        if op._loc:
-            print '{0:0>4X} \t{1}:'.format(addr, op._loc)
-        print '{0:0>4X}\t\t{1}'.format(addr, op)
+    # time every pass, on stderr or as a json report
+    stats = [a.partition('=')[2] for a in options if a != '--no-cache']
+    manager = GPCPassManager(stats=True) if stats else None
+
+    # reuse an earlier run on the same input unless told not to, or timing it
+    cache = None
+    if '--no-cache' not in options and not stats:
+        from gpclib.cache import GPCCache
+        cache = GPCCache()
+
+    # map the input instead of reading it
+    data = map_file(args[0])
+
+    if cache is None and manager is None and not is_container(data):
+        # a plain disassembly needs the decoder and nothing else
+        decoder = GPCDecoder(data)
+        try:
+            decoder.full_decode()
+        except ValueError as e:
+            print e
+        lines = decoder.disassemble()
+    else:
+        from gpclib.render import render
+        lines = render(data, cache=cache, kind='asm', manager=manager)
+
+    for line in lines:
+        print line
+
+    if manager:
+        manager.write(stats[-1])
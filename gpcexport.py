@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import sys
+from gpclib.cache import GPCCache
+from gpclib.decode import map_file
+from gpclib.export import records
+from gpclib.passes import GPCPassManager
+from gpclib.render import decode, render
+
+
+if __name__ == '__main__':
+    options = [a for a in sys.argv[1:] if a == '--no-cache' or a.split('=')[0] in ('--stats', '--format')]
+    args = [a for a in sys.argv[1:] if a not in options]
+    formats = [a.partition('=')[2] for a in options if a.split('=')[0] == '--format']
+    fmt = formats[-1] if formats else 'jsonl'
+    if len(args) != 1 or fmt not in ('jsonl', 'msgpack'):
+        print 'usage: {0} [--no-cache] [--stats[=report.json]] [--format=jsonl|msgpack] file.gbc'.format(sys.argv[0])
+        sys.exit(-1)
+    # msgpack is only needed for --format=msgpack
+    if fmt == 'msgpack':
+        try:
+            import msgpack
+        except ImportError:
+            sys.stderr.write('--format=msgpack needs the msgpack package\n')
+            sys.exit(-1)
+
+    # time every pass, on stderr or as a json report
+    stats = [a.partition('=')[2] for a in options if a.split('=')[0] == '--stats']
+    manager = GPCPassManager(stats=True) if stats else None
+
+    # reuse an earlier run on the same input unless told not to, or timing it
+    cache = None if '--no-cache' in options or stats else GPCCache()
+
+    # map the input instead of reading it
+    data = map_file(args[0])
+
+    if fmt == 'jsonl':
+        for line in render(data, cache=cache, kind='jsonl', manager=manager):
+            print line
+    else:
+        # the same records packed one after another, never cached
+        decoder, error = decode(data, 'jsonl', manager=manager)
+        if error is not None:
+            sys.stdout.write(msgpack.packb({'type': 'error', 'message': str(error)}))
+        for record in records(decoder):
+            sys.stdout.write(msgpack.packb(record))
+
+    if manager:
+        manager.write(stats[-1])
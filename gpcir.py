@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+import os
+import sys
+from gpclib.container import dump
+from gpclib.decode import map_file
+from gpclib.passes import GPCPassManager
+
+
+if __name__ == '__main__':
+    options = [a for a in sys.argv[1:] if a.split('=')[0] == '--stats']
+    args = [a for a in sys.argv[1:] if a not in options]
+    if len(args) != 2:
+        print 'usage: {0} [--stats[=report.json]] file.gbc out.gir'.format(sys.argv[0])
+        print 'decode once and keep the result, the other scripts read a .gir like a .gbc'
+        sys.exit(-1)
+
+    # time every pass, on stderr or as a json report
+    stats = [a.partition('=')[2] for a in options]
+    manager = GPCPassManager(stats=True) if stats else None
+
+    try:
+        container = dump(map_file(args[0]), manager)
+    except ValueError as e:
+        print e
+        sys.exit(1)
+
+    # write a private file and rename it into place so a reader never maps
+    # half a container
+    tmp = '{0}.tmp'.format(args[1])
+    with open(tmp, 'wb') as f:
+        f.write(container)
+    os.rename(tmp, args[1])
+
+    if manager:
+        manager.write(stats[-1])
@@ -0,0 +1,245 @@
+import cPickle as pickle
+import errno
+import hashlib
+import os
+import struct
+
+def source_version():
+    # any change to the decoder sources invalidates old entries
+    digest = hashlib.sha1()
+    base = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(base)):
+        if name.endswith('.py'):
+            with open(os.path.join(base, name), 'rb') as f:
+                digest.update(name)
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def default_path():
+    if os.environ.get('GPCDIS_CACHE'):
+        return os.environ['GPCDIS_CACHE']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'gpcdis')
+
+class GPCCache(object):
+    _version = None
+
+    def __init__(self, path=None, limit=256 * 1024 * 1024):
+        self.path = path or default_path()
+        self.limit = limit
+        if GPCCache._version is None:
+            GPCCache._version = source_version()
+        self.version = GPCCache._version
+
+    def key(self, data, kind):
+        digest = hashlib.sha1(self.version)
+        digest.update(data)
+        return '{0}.{1}'.format(digest.hexdigest(), kind)
+
+    def load(self, name):
+        path = os.path.join(self.path, name)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            # the modification time is the last use for eviction
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry.get('version') != self.version:
+            return None
+        return entry
+
+    def mkstemp(self):
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                return None
+        # write a private file and rename it into place so concurrent
+        # readers and writers only ever see complete entries; tempfile is
+        # slow to import and a hit never needs it
+        import tempfile
+        try:
+            return tempfile.mkstemp(prefix='.tmp', dir=self.path)
+        except OSError:
+            return None
+
+    def save(self, name, entry):
+        temp = self.mkstemp()
+        if temp is None:
+            return False
+        fd, tmp = temp
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, os.path.join(self.path, name))
+        except (IOError, OSError):
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def get(self, data, kind):
+        # output entries are the lines, then the pickled entry and its offset,
+        # so the lines are read back one at a time
+        path = os.path.join(self.path, self.key(data, kind))
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            f.seek(-8, os.SEEK_END)
+            offset, = struct.unpack('<Q', f.read(8))
+            f.seek(offset)
+            entry = pickle.load(f)
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, ValueError, struct.error, pickle.UnpicklingError):
+            entry = None
+        if entry is None or entry.get('version') != self.version:
+            f.close()
+            return None
+        entry['lines'] = read_lines(f, offset)
+        return entry
+
+    def writer(self, data, kind):
+        temp = self.mkstemp()
+        if temp is None:
+            return None
+        fd, tmp = temp
+        return GPCCacheWriter(self, self.key(data, kind), kind, os.fdopen(fd, 'wb'), tmp)
+
+    def get_plan(self, fingerprint):
+        entry = self.load('{0}.sub'.format(fingerprint))
+        return entry and entry['plan']
+
+    def put_plan(self, fingerprint, plan):
+        # plans are small, eviction is left to the next full put
+        self.save('{0}.sub'.format(fingerprint), {'version': self.version, 'plan': plan})
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            if name.startswith('.'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+
+        # drop the least recently used entries until we fit
+        for mtime, size, name in sorted(entries):
+            if total <= self.limit:
+                break
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+
+def read_lines(f, end):
+    with f:
+        f.seek(0)
+        position = 0
+        for line in f:
+            position += len(line)
+            if position > end:
+                break
+            yield line[:-1]
+
+class GPCCacheWriter(object):
+    # spools output lines to the cache as they are made, the entry only
+    # appears once the whole output was written
+    def __init__(self, cache, name, kind, f, tmp):
+        self.cache = cache
+        self.name = name
+        self.kind = kind
+        self.f = f
+        self.tmp = tmp
+
+    def write(self, line):
+        if self.f is None:
+            return
+        if '\n' in line:
+            self.discard()
+            return
+        try:
+            self.f.write(line)
+            self.f.write('\n')
+        except IOError:
+            self.discard()
+
+    def discard(self):
+        if self.f is None:
+            return
+        try:
+            self.f.close()
+        except IOError:
+            pass
+        try:
+            os.unlink(self.tmp)
+        except OSError:
+            pass
+        self.f = None
+
+    def commit(self, decoder, error):
+        if self.f is None:
+            return
+        store = decoder.operations
+        entry = {
+            'version': self.cache.version,
+            'kind': self.kind,
+            'error': error,
+            # address, op code and size columns of every decoded instruction
+            'instructions': (store.address.tolist(), store.opcode.tolist(), store.size.tolist()),
+            'subs': [(sub.address, sub.name) for sub in sorted(decoder.subs.values(), key=lambda s: s.address)],
+        }
+        try:
+            offset = self.f.tell()
+            pickle.dump(entry, self.f, pickle.HIGHEST_PROTOCOL)
+            self.f.write(struct.pack('<Q', offset))
+            self.f.close()
+            os.rename(self.tmp, os.path.join(self.cache.path, self.name))
+        except (IOError, OSError):
+            self.discard()
+            return
+        self.f = None
+        self.cache.evict()
+
+class GPCSubMemo(object):
+    # structure plans of subs by fingerprint, shared by every decoder given
+    # the same memo and backed by the disk cache if there is one
+    def __init__(self, cache=None):
+        self.plans = {}
+        self.seen = {}
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint):
+        plan = self.plans.get(fingerprint)
+        if plan is None and self.cache is not None:
+            plan = self.cache.get_plan(fingerprint)
+            if plan is not None:
+                self.plans[fingerprint] = plan
+        if plan is None:
+            self.misses += 1
+            self.seen[fingerprint] = self.seen.get(fingerprint, 0) + 1
+        else:
+            self.hits += 1
+        return plan
+
+    def wanted(self, fingerprint):
+        # recording a plan costs about as much as structuring the sub, so
+        # only do it for repeats or when the disk cache keeps it for later
+        return self.cache is not None or self.seen.get(fingerprint, 0) > 1
+
+    def put(self, fingerprint, plan):
+        self.plans[fingerprint] = plan
+        if self.cache is not None:
+            self.cache.put_plan(fingerprint, plan)
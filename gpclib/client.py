@@ -0,0 +1,61 @@
+import json
+import os
+import socket
+import struct
+
+# talking to gpcd.py; this module only needs the standard library so a
+# client starts without loading the decoder
+
+# a request or response: header and body lengths, a json header, the body;
+# a request body is the bytecode, a response body the output lines
+frame = struct.Struct('<II')
+
+def default_path():
+    if os.environ.get('GPCDIS_SOCKET'):
+        return os.environ['GPCDIS_SOCKET']
+    base = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(base, 'gpcdis-{0}.sock'.format(os.getuid()))
+
+def write_frame(f, header, body):
+    header = json.dumps(header)
+    f.write(frame.pack(len(header), len(body)))
+    f.write(header)
+    f.write(body)
+    f.flush()
+
+def read_frame(f):
+    # (header, body), or None once the other end has gone
+    prefix = f.read(frame.size)
+    if len(prefix) < frame.size:
+        return None
+    size, length = frame.unpack(prefix)
+    header = f.read(size)
+    body = f.read(length)
+    if len(header) < size or len(body) < length:
+        return None
+    return json.loads(header), body
+
+class GPCClient(object):
+    # one connection, any number of requests over it; socket.error if there
+    # is no daemon listening
+    def __init__(self, path=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path or default_path())
+        self.f = self.sock.makefile('rwb')
+
+    def render(self, data, kind, cache=True, stats=False):
+        # (error, lines, stats report) like render.output gives, a request
+        # the daemon failed on raises ValueError
+        write_frame(self.f, {'kind': kind, 'cache': cache, 'stats': stats}, str(data[:]))
+        response = read_frame(self.f)
+        if response is None:
+            raise socket.error('daemon closed the connection')
+        header, body = response
+        if header.get('failed'):
+            raise ValueError(header['failed'])
+        lines = body.split('\n') if header.get('lines') else []
+        return header.get('error'), lines, header.get('report')
+
+    def close(self):
+        self.f.close()
+        self.sock.close()
@@ -0,0 +1,276 @@
+import binascii
+import marshal
+import struct
+import sys
+import zlib
+from array import array
+from gpclib.decode import GPCDecoder, is_container, magic
+
+# a decoded image on disk: the bytecode, the instruction store columns, tables
+# of fixed width records and the compressed structure plan of every sub, each
+# section aligned so the file can be mapped and read in place; opening one
+# reads the header only, everything else is unpacked when first asked for;
+# the magic is in gpclib.decode so telling a container from bytecode does
+# not load this module
+version = 2
+
+header = struct.Struct('<8sII')
+# tag, offset and length of a section
+entry = struct.Struct('<4sQQ')
+
+# store columns by section, with their array type; the row of every address
+# and the sorted index are rebuilt from addr
+columns = (
+    ('addr', 'address', 'i'), ('opcd', 'opcode', 'h'), ('size', 'size', 'H'),
+    ('opr0', 0, 'i'), ('opr1', 1, 'i'), ('opr2', 2, 'i'),
+    ('push', 'pushes', 'B'), ('pops', 'pops', 'B'), ('trgt', 'target', 'i'),
+)
+
+# tables: address, kind (0 sub, 1 loc) and name of every label; fingerprint,
+# offset and length in plan of every stored plan; subs, locs, groups and
+# variable types are cheap to find again from the store and so are not kept
+tables = {
+    'labl': struct.Struct('<iBI'),
+    'plns': struct.Struct('<20sII'),
+}
+
+# strings are u32 indexes into strs, this one is none
+none = 0xFFFFFFFF
+
+def view(data, offset, length):
+    # part of a str, mmap, bytearray or buffer without copying it, a
+    # memoryview has no buffer() and is sliced instead
+    if isinstance(data, memoryview):
+        return data[offset:offset + length]
+    return buffer(data, offset, length)
+
+def raw(part):
+    # the bytes of a view for zlib, marshal and arrays, str() of a
+    # memoryview is not them
+    if isinstance(part, memoryview):
+        return part.tobytes()
+    return str(part)
+
+class GPCPlanRecorder(object):
+    # a sub memo that keeps the plan of every sub structured through it
+    def __init__(self):
+        self.plans = {}
+
+    def get(self, fingerprint):
+        return self.plans.get(fingerprint)
+
+    def wanted(self, fingerprint):
+        return True
+
+    def put(self, fingerprint, plan):
+        self.plans[fingerprint] = plan
+
+class GPCStrings(object):
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, string):
+        if string is None:
+            return none
+        sid = self.index.get(string)
+        if sid is None:
+            sid = self.index[string] = len(self.strings)
+            self.strings.append(string)
+        return sid
+
+    def pack(self):
+        offsets = array('I', [0])
+        for string in self.strings:
+            offsets.append(offsets[-1] + len(string))
+        return struct.pack('<I', len(self.strings)) + little(offsets) + ''.join(self.strings)
+
+def little(column):
+    # the file is little endian whatever the machine is
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tostring()
+
+def dump(data, manager=None):
+    # decodes data and returns the container for it, a decode error is
+    # raised as the ValueError it is
+    recorder = GPCPlanRecorder()
+    decoder = GPCDecoder(data, recorder, manager)
+    decoder.full_decode()
+    decoder.init_decode()
+    store = decoder.operations
+    strings = GPCStrings()
+    sections = [('data', raw(view(data, 0, len(data))))]
+
+    for tag, name, typecode in columns:
+        if isinstance(name, int):
+            column = store.operands[name]
+        else:
+            column = getattr(store, name)
+        sections.append((tag, little(column)))
+
+    labels = tables['labl']
+    rows = []
+    for address, op in sorted(store.views.items()):
+        if op._sub:
+            rows.append(labels.pack(address, 0, strings.add(op._sub)))
+        if op._loc:
+            rows.append(labels.pack(address, 1, strings.add(op._loc)))
+    sections.append(('labl', ''.join(rows)))
+
+    # plans by fingerprint, subs with the same shape share one
+    plans = []
+    rows = []
+    position = 0
+    for fingerprint, plan in sorted(recorder.plans.items()):
+        blob = zlib.compress(marshal.dumps(plan))
+        rows.append(tables['plns'].pack(binascii.unhexlify(fingerprint), position, len(blob)))
+        plans.append(blob)
+        position += len(blob)
+    sections += [('plns', ''.join(rows)), ('plan', ''.join(plans)), ('strs', strings.pack())]
+
+    # sections start on 8 byte boundaries after the header and directory
+    offset = header.size + entry.size * len(sections)
+    directory = []
+    for tag, blob in sections:
+        offset += -offset % 8
+        directory.append(entry.pack(tag, offset, len(blob)))
+        offset += len(blob)
+    parts = [header.pack(magic, version, len(sections))] + directory
+    position = len(parts[0]) + entry.size * len(sections)
+    for tag, blob in sections:
+        parts.append('\x00' * (-position % 8))
+        position += -position % 8
+        parts.append(blob)
+        position += len(blob)
+    return ''.join(parts)
+
+class GPCTable(object):
+    # fixed width records read in place, unpacked one at a time
+    def __init__(self, buf, record):
+        self.buf = buf
+        self.record = record
+
+    def __len__(self):
+        return len(self.buf) // self.record.size
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self.record.unpack_from(self.buf, idx * self.record.size)
+
+    def __iter__(self):
+        for idx in xrange(len(self)):
+            yield self[idx]
+
+class GPCContainer(object):
+    # a container over any buffer, usually a mapped file; it also serves as
+    # the sub memo of the decoders it makes so their subs are replayed from
+    # the stored plans
+    def __init__(self, data):
+        if not is_container(data):
+            raise ValueError('Container Error: not a container')
+        tag, found, count = header.unpack_from(data, 0)
+        if found != version:
+            raise ValueError('Container Error: version {0}, not {1}'.format(found, version))
+        self.buffer = data
+        self.sections = {}
+        for idx in xrange(count):
+            tag, offset, length = entry.unpack_from(data, header.size + idx * entry.size)
+            if offset + length > len(data):
+                raise ValueError('Container Error: section {0} past the end'.format(tag))
+            self.sections[tag] = (offset, length)
+        self.plans = None
+        self.strings = None
+
+    def section(self, tag):
+        offset, length = self.sections[tag]
+        return view(self.buffer, offset, length)
+
+    @property
+    def data(self):
+        return self.section('data')
+
+    def table(self, tag):
+        return GPCTable(self.section(tag), tables[tag])
+
+    def column(self, tag):
+        for name, attr, typecode in columns:
+            if name == tag:
+                column = array(typecode)
+                column.fromstring(raw(self.section(tag)))
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                return column
+        raise KeyError(tag)
+
+    def string(self, sid):
+        if sid == none:
+            return None
+        if self.strings is None:
+            strs = self.section('strs')
+            count, = struct.unpack_from('<I', strs, 0)
+            self.strings = (strs, 4 + (count + 1) * 4)
+        strs, base = self.strings
+        start, end = struct.unpack_from('<II', strs, 4 + sid * 4)
+        return raw(strs[base + start:base + end])
+
+    def decoder(self, manager=None):
+        return GPCStoredDecoder(self.data, self, manager, self)
+
+    # the sub memo interface, read only
+    def get(self, fingerprint):
+        if self.plans is None:
+            self.plans = {}
+            for digest, start, length in self.table('plns'):
+                self.plans[binascii.hexlify(digest)] = (start, length)
+        where = self.plans.get(fingerprint)
+        if where is None:
+            return None
+        offset, length = self.sections['plan']
+        return marshal.loads(zlib.decompress(raw(view(self.buffer, offset + where[0], where[1]))))
+
+    def wanted(self, fingerprint):
+        return False
+
+    def put(self, fingerprint, plan):
+        pass
+
+class GPCStoredDecoder(GPCDecoder):
+    # takes the instructions and labels from a container instead of decoding
+    # them; a rebuild after a patch starts without one and decodes for real
+    def __init__(self, data, memo=None, manager=None, container=None):
+        GPCDecoder.__init__(self, data, memo, manager)
+        self.container = container
+
+    def decode(self, address=0):
+        if self.container is None:
+            return GPCDecoder.decode(self, address)
+        store = self.operations
+        for tag, name, typecode in columns:
+            if isinstance(name, int):
+                store.operands[name][:] = self.container.column(tag)
+            else:
+                setattr(store, name, self.container.column(tag))
+        rows = store.rows
+        for row, address in enumerate(store.address):
+            rows[address] = row
+        self.index.addresses = array('l', sorted(store.address))
+
+    def fill_gaps(self):
+        # the gaps are data rows in the stored columns already
+        if self.container is None:
+            return GPCDecoder.fill_gaps(self)
+
+    def generate_labels(self):
+        if self.container is None:
+            return GPCDecoder.generate_labels(self)
+        store = self.operations
+        for address, kind, sid in self.container.table('labl'):
+            if kind:
+                store[address]._loc = self.container.string(sid)
+            else:
+                store[address]._sub = self.container.string(sid)
@@ -0,0 +1,133 @@
+import hashlib
+import multiprocessing
+import os
+import socket
+import SocketServer
+import threading
+import traceback
+from collections import OrderedDict
+from gpclib.cache import GPCCache, GPCSubMemo
+from gpclib.client import read_frame, write_frame
+from gpclib.passes import GPCPassManager
+from gpclib.render import kinds, output
+
+# state of a worker, made once per process so it stays warm between requests
+memo = None
+cache = None
+
+def start(disk):
+    global memo, cache
+    memo = GPCSubMemo()
+    cache = GPCCache() if disk else None
+
+def job(data, kind, cached, stats):
+    # (error, lines, stats report, failure) for one request
+    manager = GPCPassManager(stats=True) if stats else None
+    try:
+        error, lines = output(data, kind, cache if cached and not stats else None, memo, manager)
+        lines = list(lines)
+    except Exception as e:
+        return None, None, None, traceback.format_exception_only(type(e), e)[-1].strip()
+    return error, lines, manager and manager.report(), None
+
+class GPCResults(object):
+    # recent responses by input and kind, least recently used go first once
+    # they take more than limit bytes
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.pop(key, None)
+            if value is not None:
+                self.entries[key] = value
+            return value
+
+    def put(self, key, value):
+        if len(value[1]) > self.limit:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[key] = value
+            self.size += len(value[1])
+            while self.size > self.limit:
+                key, old = self.entries.popitem(last=False)
+                self.size -= len(old[1])
+
+class GPCHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        # requests on one connection are answered in order
+        while True:
+            request = read_frame(self.rfile)
+            if request is None:
+                return
+            header, body = self.server.respond(*request)
+            write_frame(self.wfile, header, body)
+
+class GPCDaemon(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    # a thread per connection only reads and writes the socket, all decoding
+    # is done by a pool of worker processes forked before any thread starts,
+    # one per cpu unless told otherwise; the sub memo, the disk cache and the
+    # op classes are never shared between requests running at once; with
+    # stats on every request is timed and its passes added to self.stats
+    daemon_threads = True
+
+    def __init__(self, path, jobs=None, limit=64 * 1024 * 1024, disk=True, stats=False):
+        self.results = GPCResults(limit)
+        self.stats = GPCPassManager(stats=True) if stats else None
+        self.lock = threading.Lock()
+        self.pool = multiprocessing.Pool(jobs, start, (disk,))
+        if os.path.exists(path):
+            # only take over a socket nobody answers on
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                os.unlink(path)
+            else:
+                raise ValueError('{0} is in use'.format(path))
+            finally:
+                probe.close()
+        # the socket is the user's alone
+        umask = os.umask(0o077)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, path, GPCHandler)
+        finally:
+            os.umask(umask)
+
+    def respond(self, options, data):
+        kind = options.get('kind')
+        if kind not in kinds:
+            return {'failed': 'unknown kind {0}'.format(kind)}, ''
+        cached = options.get('cache', True)
+        asked = options.get('stats', False)
+        stats = asked or self.stats is not None
+        key = '{0}.{1}'.format(hashlib.sha1(data).hexdigest(), kind)
+        if cached and not stats:
+            response = self.results.get(key)
+            if response is not None:
+                return response
+        error, lines, report, failed = self.pool.apply(job, (data, kind, cached, stats))
+        if failed:
+            return {'failed': failed}, ''
+        if self.stats is not None:
+            with self.lock:
+                self.stats.merge(report)
+        response = {'error': error, 'report': report if asked else None, 'lines': len(lines)}, '\n'.join(lines)
+        if cached and not stats:
+            self.results.put(key, response)
+        return response
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+        self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,114 @@
+from itertools import chain
+
+# ops that load and store the arguments of a sub, variables are the ops
+# with _variables
+arguments = ('pusha', 'popa')
+
+def slot(operation, owner):
+    # ('var', index) for a global variable or array, ('arg', sub, index) for
+    # an argument of the sub at owner, None for anything else
+    if operation._variables:
+        return ('var', operation.arguments[0])
+    if operation._name in arguments:
+        return ('arg', owner, operation.arguments[0])
+    return None
+
+class GPCDataflow(object):
+    # def-use chains over stack sinks: sinks that store to a slot are its
+    # defs, the sources that load it are its uses, keyed by the sink and
+    # operand they feed, and plain v = w stores link both slots as copies
+    def __init__(self):
+        self.defs = {}
+        self.uses = {}
+        self.copies = {}
+        # sink -> (table, slot, key, value) of everything add recorded for it
+        self.entries = {}
+
+    def add(self, sinks, owner=None):
+        defs, uses, copies = self.defs, self.uses, self.copies
+        for sink in sinks:
+            if sink in self.entries:
+                continue
+            entries = []
+            op = sink.operation
+            stored = None if op._pushes else slot(op, owner)
+            if stored is not None:
+                entries.append((defs, stored, sink, None))
+            sources = sink.sources.values()
+            if len(sources) > 1:
+                sources.sort(key=lambda s: s.address)
+            for index, source in enumerate(sources):
+                loaded = slot(source.operation, owner) if source.operation._pushes else None
+                if loaded is None:
+                    continue
+                entries.append((uses, loaded, (sink, index), source))
+                if stored is not None and len(sources) == 1 and is_copy(op, source.operation):
+                    entries.append((copies, stored, (loaded, sink), None))
+                    entries.append((copies, loaded, (stored, sink), None))
+            for table, key, value, payload in entries:
+                table.setdefault(key, {})[value] = payload
+            self.entries[sink] = entries
+
+    def remove(self, sinks):
+        for sink in sinks:
+            for table, key, value, payload in self.entries.pop(sink, ()):
+                # v = v records the same copy twice
+                values = table.get(key)
+                if values is None:
+                    continue
+                values.pop(value, None)
+                if not values:
+                    del table[key]
+
+    def closure(self, slots, copies=None):
+        # every slot reachable from slots over the copies, and over more
+        # copies in the same form if given
+        copies = copies or {}
+        found = set(slots)
+        work = list(found)
+        while work:
+            current = work.pop()
+            for other, where in chain(self.copies.get(current, ()), copies.get(current, ())):
+                if other not in found:
+                    found.add(other)
+                    work.append(other)
+        return found
+
+    def constants(self, slots=None):
+        # (slot, named constants) for loads of a variable into an operand that
+        # takes named constants, by sink address, counted the way the typing
+        # always has: only the first source of a sink
+        found = []
+        for key in self.uses if slots is None else slots:
+            if key[0] != 'var':
+                continue
+            for sink, index in self.uses.get(key, ()):
+                constants = type(sink.operation)._constants
+                if index or not constants:
+                    continue
+                snkidx = index - len(sink.operation.arguments or [])
+                if snkidx >= len(constants) or not constants[snkidx]:
+                    continue
+                found.append((sink.address, key, constants[snkidx]))
+        found.sort(key=lambda f: f[0])
+        return [(key, fact) for address, key, fact in found]
+
+    def solve(self, seeds):
+        # worklist over the copies: the fact of each seed, in order, spreads
+        # to every slot copied to or from it that no earlier seed reached
+        facts = {}
+        for start, fact in seeds:
+            if start in facts:
+                continue
+            facts[start] = fact
+            work = [start]
+            while work:
+                for other, where in self.copies.get(work.pop(), ()):
+                    if other not in facts:
+                        facts[other] = fact
+                        work.append(other)
+        return facts
+
+def is_copy(store, load):
+    # v = w and the argument forms, nothing indexed or computed
+    return store._name in ('pop', 'popa') and load._name in ('push', 'pusha')
@@ -1,59 +1,132 @@
-from gpclib.opcodes import opcodes, missing, DataOpCode, FailedOpCode
+import os
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from gpclib.dataflow import GPCDataflow, is_copy
+from gpclib.opcodes import dispatch, lengths, opcode_struct, DataOpCode
+from gpclib.passes import count_objects, default
+from gpclib.patterns import GPCComboMatcher
+from gpclib.store import GPCInstructionStore, DATA
+from gpclib.visit import GPCRewriter, groups, leaves
 
-class GPCStackSource(object):
+class GPCAddressIndex(object):
+    def __init__(self, operations):
+        self.operations = operations
+        self.addresses = array('l', sorted(operations))
+
+    def update(self, addresses):
+        # both runs are already sorted so this is a linear merge
+        self.addresses = array('l', sorted(chain(self.addresses, sorted(addresses))))
+
+    def bounds(self, start, end=None):
+        lo = bisect_left(self.addresses, start)
+        if end is None:
+            return lo, len(self.addresses)
+        return lo, bisect_left(self.addresses, end, lo)
+
+    def items(self, start=0, end=None, reverse=False):
+        lo, hi = self.bounds(start, end)
+        addresses = self.addresses[lo:hi]
+        if reverse:
+            addresses.reverse()
+        return zip(addresses, self.operations.select(addresses))
+
+    def range(self, start, end=None):
+        return GPCOperations(self, start, end)
+
+class GPCOperations(object):
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        lo, hi = self.index.bounds(self.start, self.end)
+        return hi - lo
+
+    def __contains__(self, address):
+        if address < self.start or (self.end is not None and address >= self.end):
+            return False
+        return address in self.index.operations
+
+    def __getitem__(self, address):
+        if address not in self:
+            raise KeyError(address)
+        return self.index.operations[address]
+
+    def keys(self):
+        lo, hi = self.index.bounds(self.start, self.end)
+        return list(self.index.addresses[lo:hi])
+
+    def items(self, reverse=False):
+        return self.index.items(self.start, self.end, reverse)
+
+    def values(self, reverse=False):
+        return [op for addr, op in self.items(reverse)]
+
+class GPCStackNode(object):
+    # the code of a node, rendered once per symbol state of the decoder
+    _rendered = (None, None)
+
+    def decompile(self, decoder):
+        symbols, code = self._rendered
+        if symbols is not decoder.symbols:
+            code = self.render(decoder)
+            self._rendered = (decoder.symbols, code)
+        return code
+
+class GPCStackSource(GPCStackNode):
     _fake = False
 
     def __init__(self, address, operation):
         self.address = address
         self.operation = operation
 
-    def decompile(self, decoder):
+    def render(self, decoder):
         if self._fake:
             return self._fake
-        return self.operation.decompile(decoder)
+        return self.operation.render(decoder, ())
 
-class GPCStackSink(object):
+class GPCStackSink(GPCStackNode):
     def __init__(self, address, operation, sources):
         self.address = address
         self.operation = operation
         self.sources = sources
 
     def all_sources(self):
-        sources = []
+        # the leaves under the sink, in no particular order
+        return leaves(self)
+
+    def fixups(self):
+        # the named constants the first source returning any stands for
         for source in self.sources.values():
-            if isinstance(source, GPCStackSink):
-                sources.extend(source.all_sources())
-            else:
-                sources.append(source)
-        return sources
+            if source.operation._ret_constants:
+                return source.operation._ret_constants
+        return None
 
-    def decompile(self, decoder):
-        sorted_ops = sorted(self.sources.items(), key=lambda i: i[0])
-        ret_constants = [s.operation._ret_constants for s in self.sources.values() if s.operation._ret_constants]
-        sources = [s[1].decompile(decoder) for s in sorted_ops]
-        if ret_constants:
-            for fix,up in ret_constants[0].items():
-                for i, s in enumerate(sources):
-                    if s == fix:
-                        sources[i] = up
-        return self.operation.decompile(decoder, *sources)
+    def render(self, decoder):
+        sources = self.sources
+        sources = [sources[addr].decompile(decoder) for addr in sorted(sources)]
+        fixups = self.fixups()
+        if fixups:
+            sources = [fixups.get(s, s) for s in sources]
+        return self.operation.render(decoder, sources)
 
 class GPCStackSinkSource(GPCStackSink):
-    def decompile(self, decoder):
-        sorted_ops = sorted(self.sources.items(), key=lambda i: i[0])
-        ret_constants = [s.operation._ret_constants for s in self.sources.values() if s.operation._ret_constants]
+    def render(self, decoder):
+        bounded = self.operation._bounded
         sources = []
-        for addr, source in sorted_ops:
-            if not self.operation._bounded and hasattr(source, 'sources') and not source.operation._bounded:
+        for addr in sorted(self.sources):
+            source = self.sources[addr]
+            if not bounded and hasattr(source, 'sources') and not source.operation._bounded:
                 sources.append('({0})'.format(source.decompile(decoder)))
             else:
                 sources.append(source.decompile(decoder))
-        if ret_constants:
-            for fix,up in ret_constants[0].items():
-                for i, s in enumerate(sources):
-                    if s == fix:
-                        sources[i] = up
-        return self.operation.decompile(decoder, *sources)
+        fixups = self.fixups()
+        if fixups:
+            sources = [fixups.get(s, s) for s in sources]
+        return self.operation.render(decoder, sources)
 
 class GPCFakeStackSink(object):
     def __init__(self, code):
@@ -74,24 +147,22 @@ class GPCFunctionalGroup(object):
     _closes_block = False
     next = None
     complex = False
+    # sinks as resolve_variables saw them, before any combo rewrite
+    sinks = ()
 
     def __init__(self, address, operations):
         self.address = address
         self.operations = operations
 
     def all_sinks(self):
-        sinks = []
-        sinks.append(self.final_sink)
-        for source in self.final_sink.all_sources():
-            if not isinstance(source, GPCStackSource):
-                sinks.append(source)
-        return sinks
+        # only the final sink, all_sources never gave the sinks nested under
+        # it and the typing is counted on that
+        return [self.final_sink]
 
     def simple(self):
-        sorted_ops = sorted(self.operations.items(), key=lambda i: i[0], reverse=True)
         if self.complex:
             return False
-        for idx, (addr, op) in enumerate(sorted_ops):
+        for op in self.operations.values(reverse=True):
             if not op._simple:
                 return False
         return True
@@ -100,8 +171,7 @@ class GPCFunctionalGroup(object):
         stack = []
         self.final_sink = None
         sink = None
-        sorted_ops = sorted(self.operations.items(), key=lambda i: i[0], reverse=True)
-        for idx, (addr, op) in enumerate(sorted_ops):
+        for addr, op in self.operations.items(reverse=True):
             # if this is the first iteration, store the final sink
             if not self.final_sink:
                 self.final_sink = sink = GPCStackSink(addr, op, {})
@@ -131,6 +201,65 @@ class GPCFunctionalGroup(object):
         return self.final_sink
 
 
+class GPCFlowGraph(object):
+    # control flow between the functional groups of a sub, built in one pass
+    # over them in address order: the jump ending every group and every jump
+    # into a group, with the kind of each
+    FALL = 0
+    JUMP = 1
+    JUMPZ = 2
+
+    def __init__(self, groups):
+        count = len(groups)
+        self.addresses = array('l', [g.address for g in groups])
+        self.position = dict((a, i) for i, a in enumerate(self.addresses))
+        # kind of the jump ending each group and the position it goes to,
+        # -1 for no jump or a jump out of the sub
+        self.kinds = array('b', [self.FALL]) * count
+        self.targets = array('l', [-1]) * count
+        # (position, kind) of the jumps into a position, in address order
+        self.incoming = {}
+        for i, group in enumerate(groups):
+            if group._jump:
+                kind, target = self.JUMP, group._jump
+            elif group._jumpz:
+                kind, target = self.JUMPZ, group._jumpz
+            else:
+                continue
+            self.kinds[i] = kind
+            position = self.position.get(target)
+            if position is None:
+                continue
+            self.targets[i] = position
+            self.incoming.setdefault(position, []).append((i, kind))
+
+    def jumped_from(self, address, kind):
+        # the last jump of a kind into a group, False if there is none, the
+        # jump over the data segment at 0 is not counted
+        for i, k in reversed(self.incoming.get(self.position[address], ())):
+            if k == kind and (kind == self.JUMPZ or self.addresses[i] != 0):
+                return self.addresses[i]
+        return False
+
+    def link(self, groups):
+        # set the next, _jumped and _jumpzed fields resolve and fix_combos
+        # read, the last jump of each kind into a group wins
+        ordered = [groups[a] for a in self.addresses]
+        last = None
+        for i, group in enumerate(ordered):
+            kind = self.kinds[i]
+            if kind == self.JUMP and group.address != 0 or kind == self.JUMPZ:
+                target = self.targets[i]
+                if target < 0:
+                    raise KeyError(group._jump or group._jumpz)
+                if kind == self.JUMP:
+                    ordered[target]._jumped = group.address
+                else:
+                    ordered[target]._jumpzed = group.address
+            if last:
+                last.next = group
+            last = group
+
 class GPCLoc(object):
     def __init__(self, address, operations):
         self.address = address
@@ -140,46 +269,46 @@ class GPCLoc(object):
     def split_functional_groups(self):
         stack_depth = 0
         self.groups = {}
+        index = self.operations.index
         group = None
-        sorted_ops = sorted(self.operations.items(), key=lambda i: i[0])
-        for idx, (addr, op) in enumerate(sorted_ops):
+        for addr, op in self.operations.items():
             # start a new functional group if we hit the stack bottom
             if stack_depth == 0:
                 if group:
+                    group.operations.end = addr
                     self.groups[group.address] = group
-                group = GPCFunctionalGroup(addr, {})
+                group = GPCFunctionalGroup(addr, index.range(addr))
 
             # check stack depth
             if op._pops > stack_depth:
                 raise ValueError('DecodeError at {0.address:0>4X}: tried to pop {0._pops} off stack of {1}'.format(op, stack_depth))
 
-            # add the current op to the group
-            group.operations[addr] = op
-
             # do the stack math
             stack_depth += op._pushes - op._pops
         if group:
+            group.operations.end = self.operations.end
             self.groups[group.address] = group
         for group in self.groups.values():
-            sorted_ops = sorted(group.operations.items(), key=lambda i: i[0], reverse=True)
-            for idx, (addr, op) in enumerate(sorted_ops):
+            size = len(group.operations)
+            for addr, op in group.operations.items(reverse=True):
                 # we cannot make a single operation group smaller
-                if len(group.operations) == 1: break
+                if size == 1: break
             
                 # last operation does not rely on previous operation
                 # probably a jump
                 if not op._pushes and not op._pops:
-                    group.operations.pop(addr)
-                    g = GPCFunctionalGroup(addr, {addr: op})
+                    g = GPCFunctionalGroup(addr, index.range(addr, group.operations.end))
+                    group.operations.end = addr
                     self.groups[g.address] = g
                 # last item in functional group cannot push
                 # probably a function call with an ingored return
                 elif op._pushes:
-                    group.operations.pop(addr)
-                    g = GPCFunctionalGroup(addr, {addr: op})
+                    g = GPCFunctionalGroup(addr, index.range(addr, group.operations.end))
+                    group.operations.end = addr
                     self.groups[g.address] = g
                 # normal ending
                 else: break
+                size -= 1
         for group in self.groups.values():
             group.resolve()
         return self.groups
@@ -201,23 +330,24 @@ class GPCBlock(object):
             self.address -= 0.5
 
     def all_groups(self):
-        groups = {}
-        for group in self.groups.values():
-            if isinstance(group, GPCBlock):
-                groups.update(group.all_groups())
-            else:
-                groups[group.address] = group
-        return groups
+        return dict((group.address, group) for group, depth in groups(self)
+            if not isinstance(group, GPCBlock))
 
     def decompile(self, decoder, level = 0):
-        lines = []
-        for group in sorted(self.groups.values(), key=lambda g: g.address):
-            if isinstance(group, GPCBlock):
+        # nested blocks go on a stack rather than recursing, so each line is
+        # yielded once instead of being copied up through every level
+        stack = [(self, level, iter(sorted(self.groups.values(), key=lambda g: g.address)))]
+        while stack:
+            block, level, groups = stack[-1]
+            group = next(groups, None)
+            if group is None:
+                stack.pop()
+                if stack and not block._closing:
+                    yield '{0}}}'.format('\t' * (level - 1))
+            elif isinstance(group, GPCBlock):
                 if group._else:
-                    lines.append('{0}}} else {{'.format('\t' * level))
-                lines.extend(group.decompile(decoder, level + 1))
-                if not group._closing:
-                    lines.append('{0}}}'.format('\t' * level))
+                    yield '{0}}} else {{'.format('\t' * level)
+                stack.append((group, level + 1, iter(sorted(group.groups.values(), key=lambda g: g.address))))
             else:
                 endl = ';'
                 startl = ''
@@ -227,8 +357,7 @@ class GPCBlock(object):
                     endl = ' {'
                 code = group.final_sink.decompile(decoder)
                 if code:
-                    lines.append('{0}{1}{2}{3}'.format('\t' * level, startl, code, endl))
-        return lines
+                    yield '{0}{1}{2}{3}'.format('\t' * level, startl, code, endl)
 
 class GPCSub(object):
     _pops = 0
@@ -241,6 +370,7 @@ class GPCSub(object):
         self.operations = operations
         self.locs = {}
         self.groups = {}
+        self.cfg = None
 
     def generate_prototype(self):
         if self.name == 'start': return 'start'
@@ -254,28 +384,26 @@ class GPCSub(object):
     def split_locs(self):
         self.locs = {}
         self.groups = {}
+        index = self.operations.index
         loc = None
-        sorted_ops = sorted(self.operations.items(), key=lambda i: i[0])
-        for idx, (addr, op) in enumerate(sorted_ops):
+        for addr, op in self.operations.items():
             if op._sub or op._loc:
                 if loc:
+                    loc.operations.end = addr
                     self.locs[loc.address] = loc
-                loc = GPCLoc(op.address, {})
-            loc.operations[op.address] = op
+                loc = GPCLoc(op.address, index.range(addr))
         if loc:
+            loc.operations.end = self.operations.end
             self.locs[loc.address] = loc
-        for loc in self.locs.values():
-            loc.split_functional_groups()
-            self.groups.update(loc.groups)
-        last = None
-        for group in sorted(self.groups.values(), key=lambda g: g.address):
-            if group._jump and group.address != 0:
-                self.groups[group._jump]._jumped = group.address
-            if group._jumpz:
-                self.groups[group._jumpz]._jumpzed = group.address
-            if last:
-                last.next = group
-            last = group
+        try:
+            for loc in self.locs.values():
+                loc.split_functional_groups()
+                self.groups.update(loc.groups)
+        finally:
+            # the groups that did split are still rendered, so they get a
+            # graph even when a later loc fails
+            self.cfg = GPCFlowGraph(sorted(self.groups.values(), key=lambda g: g.address))
+        self.cfg.link(self.groups)
         return sorted(self.locs.values(), key=lambda s: s.address)
 
     def resolve(self):
@@ -283,6 +411,47 @@ class GPCSub(object):
         self.root = None
         block = None
         stack = []
+        # while loops on the stack by the address they exit to, so a break
+        # is found without scanning the stack
+        exits = {}
+        # the group each jumpz chain ends at, see chain_end
+        chains = {}
+
+        def push(b):
+            stack.append(b)
+            if b._while:
+                exits[b._condition._jumpz] = exits.get(b._condition._jumpz, 0) + 1
+
+        def pop():
+            b = stack.pop()
+            if b._while:
+                exits[b._condition._jumpz] -= 1
+            return b
+
+        cfg = self.cfg
+        kinds, targets, addresses = cfg.kinds, cfg.targets, cfg.addresses
+
+        def chain_end(node):
+            # address of the first group without a jumpz on the chain of jumpz
+            # targets from node, None if the chain goes backwards or leaves
+            # the sub, shared by every group on the chain
+            path = []
+            i = cfg.position[node.address]
+            while i not in chains:
+                path.append(i)
+                if kinds[i] != cfg.JUMPZ:
+                    end = addresses[i]
+                    break
+                if targets[i] <= i:
+                    end = None
+                    break
+                i = targets[i]
+            else:
+                end = chains[i]
+            for i in path:
+                chains[i] = end
+            return end
+
         for group in sorted_groups:
             # store the root group
             if not self.root:
@@ -290,7 +459,7 @@ class GPCSub(object):
 
             # pop the next block off the stack if we are at the end
             while block.end == group.address and len(stack):
-                block = stack.pop()
+                block = pop()
 
             # this group is super fucking boring
             if not (group._jump or group._jumpz) and not (group._jumped or group._jumpzed):
@@ -302,7 +471,7 @@ class GPCSub(object):
                 group._opens_block = True
 
                 # put the current block on the stack
-                stack.append(block)
+                push(block)
                 
                 # put the block opener in the current block
                 block.groups[group.address] = group
@@ -318,11 +487,10 @@ class GPCSub(object):
             elif block._condition and group._jump == block._condition.address:
                 block.groups[group.address] = group
                 group.block = block
-                block = stack.pop()
+                block = pop()
             elif block._condition and group._jump:
-                parents = [p for p in stack if p._while and p._condition._jumpz == group._jump]
                 # this group is a break statement within a while loop
-                if parents:
+                if exits.get(group._jump):
                     group.final_sink.operation._fmt_decompile = 'break'
                     block.groups[group.address] = group
                     group.block = block
@@ -332,13 +500,13 @@ class GPCSub(object):
                     group.block = block
                     block._closing = True
                     cond = block._condition
-                    block = stack.pop()
+                    block = pop()
                     block._else_pending = group._jump
                     block._else_condition = cond
             # this group is an else block
             elif group._jumpzed and not (group._jump or group._jumpz) and block._else_pending:
                 # put the current block on the stack
-                stack.append(block)
+                push(block)
                 
                 # create the nested block
                 b = GPCBlock(group.address, block._else_pending, {group.address: group})
@@ -353,18 +521,24 @@ class GPCSub(object):
                 group.block = block
             elif group._jumpzed and group._jumpz and block._else_pending:
                 next = self.groups[group._jumpz]
-                found = False
-                while next.address < block._else_pending:
-                    if not next._jumpz:
-                        found = True
-                        break
-                    next = self.groups[next._jumpz]
+                end = chain_end(next)
+                if end is not None:
+                    # the chain only goes forward, so it reaches its end
+                    # before the else does exactly when the end comes first
+                    found = end < block._else_pending
+                else:
+                    found = False
+                    while next.address < block._else_pending:
+                        if not next._jumpz:
+                            found = True
+                            break
+                        next = self.groups[next._jumpz]
                 # this group is an if condition at the start of an else block
                 if found:
                     group._opens_block = True
                     
                     # put the current block on the stack
-                    stack.append(block)
+                    push(block)
                     
                     # create the else block and put it on the stack
                     b = GPCBlock(group.address, block._else_pending, {})
@@ -373,7 +547,7 @@ class GPCSub(object):
                     b._condition = block._else_condition
                     block.groups[b.address] = b
                     block = b
-                    stack.append(block)
+                    push(block)
                     
                     # put the block opener in the current block
                     block.groups[group.address] = group
@@ -392,7 +566,7 @@ class GPCSub(object):
                     group._closes_block = True
 
                     # put the current block on the stack
-                    stack.append(block)
+                    push(block)
                     
                     # put the block opener in the current block
                     block.groups[group.address] = group
@@ -408,7 +582,7 @@ class GPCSub(object):
                 group._opens_block = True
                 
                 # put the current block on the stack
-                stack.append(block)
+                push(block)
                 
                 # put the block opener in the current block
                 block.groups[group.address] = group
@@ -420,13 +594,214 @@ class GPCSub(object):
                 block.groups[b.address] = b
                 block = b
 
+    def fingerprint(self):
+        # hash of the instruction stream with jump targets relative to the
+        # sub start, call targets are left out as they do not change the shape
+        store = self.decoder.operations
+        views = store.views
+        base = self.address
+        index = self.operations.index
+        lo, hi = index.bounds(self.operations.start, self.operations.end)
+        addresses = index.addresses[lo:hi]
+        rows = map(store.rows.__getitem__, addresses)
+        opcodes = map(store.opcode.__getitem__, rows)
+        targets = map(store.target.__getitem__, rows)
+        operands = [map(column.__getitem__, rows) for column in store.operands]
+        for i, target in enumerate(targets):
+            if target < 0:
+                continue
+            for column in operands:
+                column[i] = 0
+            targets[i] = target - base if dispatch[opcodes[i]]._jump else 0
+        labels = [a - base for a in addresses if a in views and (views[a]._sub or views[a]._loc)]
+
+        # only subs structured through a memo are hashed
+        import hashlib
+        digest = hashlib.sha1(array('i', [len(addresses), len(labels)]).tostring())
+        digest.update(array('i', [a - base for a in addresses]).tostring())
+        for column in [opcodes, targets, labels] + operands:
+            digest.update(array('i', column).tostring())
+        for column in (store.size, store.pushes, store.pops):
+            digest.update(array('i', map(column.__getitem__, rows)).tostring())
+        return digest.hexdigest()
+
+    def plan(self, formats):
+        # relocatable record of what split_locs and resolve built, formats
+        # holds the final sink formats from before resolve rewrote them
+        base = self.address
+
+        def offset(address):
+            if address is None or address is False:
+                return None
+            return address - base
+
+        def sink(s):
+            if isinstance(s, GPCStackSinkSource):
+                kind = 1
+            elif isinstance(s, GPCStackSink):
+                kind = 0
+            else:
+                return (s.address - base, 2, ())
+            # sources went in highest address first, keep that dict order
+            children = [sink(c) for a, c in sorted(s.sources.items(), reverse=True)]
+            return (s.address - base, kind, tuple(children))
+
+        def block(b):
+            attrs = []
+            for name, value in b.__dict__.items():
+                if name in ('address', 'end', 'groups'):
+                    continue
+                if isinstance(value, GPCFunctionalGroup):
+                    attrs.append((name, 'group', value.address - base))
+                elif isinstance(value, bool):
+                    attrs.append((name, 'value', value))
+                else:
+                    attrs.append((name, 'address', value - base))
+            children = []
+            for child in b.groups.values():
+                if isinstance(child, GPCBlock):
+                    children.append(('block', block(child)))
+                else:
+                    children.append(('group', child.address - base))
+            return (b.address - base, None if b.end == -1 else b.end - base, tuple(attrs), tuple(children))
+
+        groups = []
+        changed = []
+        for group in sorted(self.groups.values(), key=lambda g: g.address):
+            groups.append((group.address - base, offset(group.operations.end),
+                offset(group._jump), offset(group._jumpz), offset(group._jumped), offset(group._jumpzed),
+                group._opens_block, group._closes_block, sink(group.final_sink)))
+            fmt = group.final_sink.operation._fmt_decompile
+            if fmt != formats[group.address]:
+                changed.append((group.address - base, fmt))
+        locs = []
+        for loc in sorted(self.locs.values(), key=lambda l: l.address):
+            locs.append((loc.address - base, offset(loc.operations.end), tuple(a - base for a in loc.groups)))
+        root = block(self.root) if self.root else None
+        return (tuple(groups), tuple(locs), root, tuple(changed))
+
+    def replay(self, plan):
+        # rebuild what split_locs and resolve would on this sub from a plan
+        base = self.address
+        index = self.operations.index
+        ops = dict(self.operations.items())
+        groups, locs, root, changed = plan
+
+        def address(offset):
+            return None if offset is None else base + offset
+
+        def sink(node):
+            offset, kind, children = node
+            a = base + offset
+            if kind == 2:
+                return GPCStackSource(a, ops[a])
+            sources = {}
+            for child in children:
+                sources[base + child[0]] = sink(child)
+            if kind == 1:
+                return GPCStackSinkSource(a, ops[a], sources)
+            return GPCStackSink(a, ops[a], sources)
+
+        def block(node):
+            offset, end, attrs, children = node
+            b = GPCBlock(base + offset, -1 if end is None else base + end, {})
+            for name, kind, value in attrs:
+                if kind == 'group':
+                    value = self.groups[base + value]
+                elif kind == 'address':
+                    value = base + value
+                setattr(b, name, value)
+            for kind, child in children:
+                if kind == 'block':
+                    child = block(child)
+                else:
+                    child = self.groups[base + child]
+                    child.block = b
+                b.groups[child.address] = child
+            return b
+
+        self.groups = {}
+        last = None
+        for start, end, jump, jumpz, jumped, jumpzed, opens, closes, final in groups:
+            group = GPCFunctionalGroup(base + start, index.range(base + start, address(end)))
+            if jump is not None:
+                group._jump = base + jump
+            if jumpz is not None:
+                group._jumpz = base + jumpz
+            if jumped is not None:
+                group._jumped = base + jumped
+            if jumpzed is not None:
+                group._jumpzed = base + jumpzed
+            if opens:
+                group._opens_block = True
+            if closes:
+                group._closes_block = True
+            group.final_sink = sink(final)
+            if last:
+                last.next = group
+            last = group
+            self.groups[group.address] = group
+        self.cfg = GPCFlowGraph(sorted(self.groups.values(), key=lambda g: g.address))
+        self.locs = {}
+        for start, end, members in locs:
+            loc = GPCLoc(base + start, index.range(base + start, address(end)))
+            for offset in members:
+                loc.groups[base + offset] = self.groups[base + offset]
+            self.locs[loc.address] = loc
+        for offset, fmt in changed:
+            self.groups[base + offset].final_sink.operation._fmt_decompile = fmt
+        self.root = block(root) if root else None
+
+    def structure(self, memo=None):
+        # split_locs and resolve, replayed from the memo for a sub seen before,
+        # either way the formats of final sinks change
+        self.decoder.invalidate()
+        if memo is None:
+            self.split_locs()
+            self.resolve()
+            return
+        fingerprint = self.fingerprint()
+        plan = memo.get(fingerprint)
+        if plan is not None:
+            self.replay(plan)
+            return
+        self.split_locs()
+        if not memo.wanted(fingerprint):
+            self.resolve()
+            return
+        formats = dict((g.address, g.final_sink.operation._fmt_decompile) for g in self.groups.values())
+        self.resolve()
+        memo.put(fingerprint, self.plan(formats))
+
     def decompile(self):
         return self.root.decompile(self.decoder)
 
+# the first bytes of a container made by gpclib.container, an input a
+# decoder never takes as bytecode
+magic = 'GPCIR\x00\r\n'
+
+def is_container(data):
+    # the magic, a version and a section count
+    return len(data) >= len(magic) + 8 and data[:len(magic)] == magic
+
+def map_file(path):
+    # the mapping stays valid after the file is closed
+    import mmap
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return f.read()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
 class GPCDecoder(object):
-    def __init__(self, data):
+    # data can be anything with the buffer interface: a str, mmap,
+    # bytearray, memoryview or buffer, it is never copied
+    def __init__(self, data, memo=None, manager=None):
         self.data = data
-        self.operations = {}
+        # shared structure of subs seen in this or earlier files, if any
+        self.memo = memo
+        self.operations = GPCInstructionStore(data)
+        self.index = GPCAddressIndex(self.operations)
+        self.visited = bytearray(max(0x10000, len(data)))
         self.subs = {}
         self.start = None
         self.init = None
@@ -434,61 +809,379 @@ class GPCDecoder(object):
         self.maps = None
         self.combos = None
         self.combo_count = 0
+        self.matcher = GPCComboMatcher(0)
         self.t0 = None
         self.variables = {}
+        self.layout = []
+        self.sinks = {}
+        # rendered nodes are cached against this, passes that change how
+        # nodes render replace it through invalidate
+        self.symbols = object()
+        self.flow = GPCDataflow()
+        # lazy mode: (sub, loc) pairs that can type each variable, copies
+        # between slots in the form of GPCDataflow.copies with (sub, loc) for
+        # the copying sink, subs the column walk could not follow, locs split
+        # only for typing, and subs structured, fixed up and variables typed
+        # so far
+        self.typers = {}
+        self.copies = {}
+        self.unsure = set()
+        self.labels = array('l')
+        self.partial = {}
+        self.resolved = set()
+        self.fixed = set()
+        self.typed = set()
+        # pipelines asked for and pipelines that ran to the end, and the
+        # passes they ran
+        self.manager = manager or default
+        self.passes = []
+        self.done = []
+        self.ran = set()
+
+    def disassemble(self):
+        # a line per instruction decoded, after a label line where one starts
+        for addr, op in self.index.items():
+            if op._sub:
+                yield '{0:0>4X} {1}:'.format(addr, op._sub)
+            if op._loc:
+                yield '{0:0>4X} \t{1}:'.format(addr, op._loc)
+            yield '{0:0>4X}\t\t{1}'.format(addr, op)
 
     def full_decode(self):
-        self.decode(0)
-        self.fill_gaps()
-        self.generate_labels()
-        self.split_subs()
-        self.resolve_allocs()
-        self.normalize_init()
-        self.resolve()
-        self.resolve_variables()
+        self.manager.run(self, 'full_decode')
 
     def combo_decode(self):
-        self.split_combos()
-        self.resolve_combos()
-        self.fix_run_combo()
+        self.manager.run(self, 'combo_decode')
 
     def init_decode(self):
-        self.renormalize_init()
+        self.manager.run(self, 'init_decode')
+
+    def lazy_decode(self):
+        # find the subs and set up init, everything else waits for resolve_sub
+        self.manager.run(self, 'lazy_decode')
+
+    def resolve_init(self):
+        # after lazy_decode init still needs its variables typed
+        if 'lazy_decode' in self.done and self.init:
+            self.resolve_sub(self.init.address)
+
+    def lazy_init(self):
+        for sub in (self.start, self.init):
+            if sub:
+                self.resolved.add(sub.address)
+        if self.init:
+            self.collect_sinks(self.init.groups, self.init.address)
 
-    def decode(self, address):
-        if address in self.operations:
+    def find_typers(self):
+        # follow the stack over the store columns to find, for every variable,
+        # the subs where infer_variables would type it and every copy it could
+        # get its type through, without any groups
+        store = self.operations
+        views = store.views
+        opcodes = store.opcode
+        operand = store.operands[0]
+
+        def slot(row):
+            if dispatch[opcodes[row]]._variables:
+                return ('var', operand[row])
+            return ('arg', sub, operand[row])
+
+        self.labels = array('l', sorted(a for a, o in views.items() if o._sub or o._loc))
+        start = self.start and self.start.address
+        sub = loc = None
+        stack = []
+        for addr in self.index.addresses:
+            op = views.get(addr)
+            if op is not None and (op._sub or op._loc):
+                # locs start with an empty stack, as in split_functional_groups
+                stack = []
+                loc = addr
+                if op._sub:
+                    sub = addr
+            # the data segment is never part of the variable typing
+            if sub == start:
+                continue
+            row = store.rows[addr]
+            if opcodes[row] == DATA:
+                continue
+            cls = dispatch[opcodes[row]]
+            pops = store.pops[row]
+            if pops > len(stack) or store.pushes[row] > 1:
+                self.unsure.add(sub)
+                stack = []
+                continue
+            if pops:
+                sources = stack[-pops:]
+                del stack[-pops:]
+                constants = cls._constants
+                arguments = len(cls._arguments) if cls._struct is not None else 0
+                for sidx, source in enumerate(sources if constants else ()):
+                    snkidx = sidx - arguments
+                    if snkidx < -len(constants):
+                        self.unsure.add(sub)
+                        break
+                    if snkidx >= len(constants) or not constants[snkidx]: continue
+                    variables = dispatch[opcodes[source]]._variables
+                    if not variables or sidx >= len(variables) or not variables[sidx]: continue
+                    self.typers.setdefault(operand[source], set()).add((sub, loc))
+                if pops == 1 and is_copy(cls, dispatch[opcodes[sources[0]]]):
+                    stored, loaded = slot(row), slot(sources[0])
+                    self.copies.setdefault(stored, {})[(loaded, (sub, loc))] = None
+                    self.copies.setdefault(loaded, {})[(stored, (sub, loc))] = None
+            if store.pushes[row]:
+                stack.append(row)
+
+    def find_sub(self, key):
+        # by name or by address
+        for sub in self.layout:
+            if sub.name == key or sub.address == key:
+                return sub
+        raise KeyError(key)
+
+    def resolve_sub(self, key):
+        # what full_decode and combo_decode do, for one sub, plus the locs
+        # elsewhere that type its variables
+        stats = self.manager.stats is not None
+        if stats:
+            started = time.time()
+        sub = self.find_sub(key)
+        store = self.operations
+        wanted = set()
+        for addr in sub.operations.keys():
+            row = store.rows[addr]
+            opcode = store.opcode[row]
+            if opcode != DATA and dispatch[opcode]._variables:
+                wanted.add(store.operands[0][row])
+        wanted -= self.typed
+
+        # whole subs for the requested one and anything the walk was unsure of
+        addresses = set([sub.address])
+        if wanted:
+            addresses.update(self.unsure)
+        for s in self.layout:
+            if s.address not in addresses or s.address in self.resolved:
+                continue
+            for loc in self.partial.pop(s.address, {}).values():
+                self.drop_sinks(loc.groups)
+            s.structure(self.memo)
+            self.collect_sinks(s.groups, s.address)
+            self.resolved.add(s.address)
+
+        # a variable is typed together with everything copied to or from it,
+        # so only the locs that type or copy one of those anywhere else
+        if wanted:
+            slots = self.flow.closure([('var', var) for var in wanted], self.copies)
+            # with nothing in reach that can type them the copies do not matter
+            if not [key for key in slots if key[0] == 'var' and key[1] in self.typers] \
+                    and not self.flow.constants(slots):
+                slots = ()
+            for key in slots:
+                if key[0] == 'var':
+                    for s, start in self.typers.get(key[1], ()):
+                        self.split_loc(s, start)
+                for other, (s, start) in self.copies.get(key, ()):
+                    self.split_loc(s, start)
+            # the copies the walk saw are a guess, the sinks have the real ones
+            slots = self.flow.closure([('var', var) for var in wanted])
+            wanted = set(key[1] for key in slots if key[0] == 'var') - self.typed
+            self.infer_variables(wanted)
+            self.typed.update(wanted)
+
+        # every variable of the sub is typed by now, other subs get theirs
+        # applied when they are resolved; typing and the combo fixes share one
+        # walk over the sub, and over the combos for main
+        if sub.address not in self.fixed and sub is not self.start:
+            blocks = [sub.root]
+            if sub is self.main:
+                self.split_combos()
+                self.resolve_combos()
+                blocks.extend(self.combos or ())
+            rules = [GPCVariableTypes(self)]
+            if self.combo_count:
+                rules.append(GPCComboFixes(self))
+            GPCRewriter(rules).run(*blocks)
+            self.fixed.add(sub.address)
+        if stats:
+            self.manager.record('resolve_sub', time.time() - started, count_objects(self))
+        return sub
+
+    def split_loc(self, address, start):
+        # groups of one loc of a sub that is not resolved, for typing only
+        partial = self.partial.setdefault(address, {})
+        if address in self.resolved or start in partial:
+            return
+        idx = bisect_right(self.labels, start)
+        end = self.labels[idx] if idx < len(self.labels) else None
+        loc = GPCLoc(start, self.index.range(start, end))
+        loc.split_functional_groups()
+        self.collect_sinks(loc.groups, address)
+        partial[start] = loc
+
+    def release_sub(self, sub):
+        # drop what resolve_sub built for a sub that has been written out,
+        # start and init stay as lazy_decode left them and unsure subs would
+        # only be structured again, main gives up its combos the next time
+        # it is resolved
+        if sub in (self.start, self.init) or sub.address in self.unsure:
             return
-        opcode = ord(self.data[address])
-        if opcode in missing:
-            o = FailedOpCode(self.data, address, missing[opcode])
-            self.operations[address] = o
-            return self.decode(address + o.size)
-        for op in opcodes:
-            if op._op != opcode:
+        self.drop_sinks(sub.groups)
+        sub.locs = {}
+        sub.groups = {}
+        sub.cfg = None
+        sub.root = None
+        self.resolved.discard(sub.address)
+        self.fixed.discard(sub.address)
+        # unlabelled operations get built again from the store if needed
+        views = self.operations.views
+        for addr in sub.operations.keys():
+            op = views.get(addr)
+            if op is not None and not (op._sub or op._loc):
+                del views[addr]
+
+    def rebuild(self):
+        passes = self.passes
+        data, memo, manager = self.data, self.memo, self.manager
+        # start from a clean slate so nothing from the old decode survives
+        self.__dict__.clear()
+        self.__init__(data, memo, manager)
+        for name in passes:
+            getattr(self, name)()
+
+    def patch(self, offset, data):
+        # overwrite bytes and redo only the subs they fall in, anything that
+        # can move code, labels, allocs or combos means a full rebuild
+        end = offset + len(data)
+        if offset < 0 or end > len(self.data):
+            raise ValueError('Patch Error at {0:0>4X}: {1} bytes past the end'.format(offset, max(0, end - len(self.data))))
+        if not isinstance(self.data, bytearray):
+            self.data = bytearray(self.data)
+            self.operations.data = self.data
+        self.data[offset:end] = data
+
+        # every instruction or data run the patch overlaps
+        store = self.operations
+        addresses = self.index.addresses
+        touched = []
+        local = self.passes == self.done and 'full_decode' in self.done
+        for idx in range(max(0, bisect_right(addresses, offset) - 1), len(addresses)):
+            addr = addresses[idx]
+            if addr >= end:
+                break
+            row = store.rows[addr]
+            if addr + store.size[row] <= offset:
                 continue
-            o = op()
-            l = o.parse(self.data, address)
-            self.operations[address] = o
-            address += l
-            break
-        else:
-            raise ValueError('Decode Error at {0:0>4X}: {1:X}'.format(address, opcode))
-        if o._jump and o._conditional:
-            self.decode(o.jump_address)
-        elif o._jump:
-            address = o.jump_address
-        if address < len(self.data):
-            self.decode(address)
+            touched.append(addr)
+            opcode = store.opcode[row]
+            if opcode == DATA:
+                continue
+            op = dispatch[opcode]
+            if addr >= offset and self.data[addr] != opcode:
+                local = False
+            elif op._jump or op._call or op._pops_argument is not None or op._pushes_argument is not None:
+                local = False
+            elif op._name in ('main', 'alloc'):
+                local = False
+        if not touched:
+            return
+
+        subs = {}
+        starts = [sub.address for sub in self.layout]
+        for addr in touched:
+            if not local:
+                break
+            sub = self.layout[bisect_right(starts, addr) - 1]
+            if sub.name == 'init' or (sub.name == 'main' and self.combo_count):
+                local = False
+            elif sub is self.start and store.opcode[store.rows[addr]] != DATA:
+                local = False
+            subs[sub.address] = sub
+        if not local:
+            self.rebuild()
+            return
+
+        # decode the touched instructions again, keeping their labels
+        for addr in touched:
+            old = store.views.get(addr)
+            row = store.rows[addr]
+            if store.opcode[row] == DATA:
+                store[addr] = DataOpCode(self.data, addr, store.size[row])
+            else:
+                store.decode(dispatch[store.opcode[row]], addr)
+            if old is not None and (old._sub or old._loc):
+                op = store.operation(addr)
+                op._sub = old._sub
+                op._loc = old._loc
+
+        # structure the touched subs again and redo the passes over all subs
+        for sub in subs.values():
+            if sub is self.start:
+                sub.split_locs()
+                sub.resolve()
+                continue
+            self.drop_sinks(sub.groups)
+            sub.structure(self.memo)
+            self.collect_sinks(sub.groups, sub.address)
+        for sink in self.sinks:
+            if sink.operation._variables:
+                sink.operation.__dict__.pop('_constants', None)
+        self.invalidate()
+        self.infer_variables()
+        if 'combo_decode' in self.done:
+            for sub in subs.values():
+                if sub is not self.start:
+                    self.fix_combos(sub.root)
+        if 'init_decode' in self.done:
+            for var, group in self.init_values:
+                self.alloc_values[var] = group.final_sink.decompile(self)
+
+    def decode(self, address=0):
+        data = self.data
+        end = len(data)
+        operations = self.operations
+        visited = self.visited
+        decoded = []
+        # addresses are taken last in first out so branch targets are
+        # fully decoded before the fall through, same as the instruction
+        # order a recursive walk would produce
+        pending = [address]
+        try:
+            while pending:
+                address = pending.pop()
+                while not visited[address]:
+                    opcode = opcode_struct.unpack_from(data, address)[0]
+                    op = dispatch[opcode]
+                    if op is None:
+                        raise ValueError('Decode Error at {0:0>4X}: {1:X}'.format(address, opcode))
+                    row = operations.decode(op, address)
+                    decoded.append(address)
+                    visited[address] = 1
+                    address += lengths[opcode]
+                    if op._jump and op._conditional:
+                        if address < end:
+                            pending.append(address)
+                        address = operations.target[row]
+                        continue
+                    elif op._jump:
+                        address = operations.target[row]
+                    if address >= end:
+                        break
+        finally:
+            # keep the index in step with whatever got decoded
+            self.index.update(decoded)
 
     def fill_gaps(self):
-        sorted_ops = sorted(self.operations.items(), key=lambda i: i[0])
-        for idx, (addr, op) in enumerate(sorted_ops):
-            if idx + 1 < len(sorted_ops):
-                end = addr + op.size
-                next = sorted_ops[idx+1][0]
-                if end < next:
-                    size = next - end
-                    self.operations[end] = DataOpCode(self.data, end, size)
+        gaps = []
+        store = self.operations
+        addresses = self.index.addresses
+        for idx in range(len(addresses) - 1):
+            addr = addresses[idx]
+            end = addr + store.size[store.rows[addr]]
+            next = addresses[idx+1]
+            if end < next:
+                size = next - end
+                self.operations[end] = DataOpCode(self.data, end, size)
+                gaps.append(end)
+        self.index.update(gaps)
 
     def generate_labels(self):
         self.operations[0]._sub = 'start'
@@ -497,38 +1190,51 @@ class GPCDecoder(object):
             self.operations[self.operations[0].jump_address]._sub = 'init'
         else:
             self.operations[0]._sub = 'init'
-        sorted_ops = sorted(self.operations.items(), key=lambda i: i[0])
-        for idx, (addr, op) in enumerate(sorted_ops):
+        # work on the store columns so only labelled operations get built
+        store = self.operations
+        for addr in self.index.addresses:
+            row = store.rows[addr]
+            if store.opcode[row] == DATA:
+                continue
+            op = dispatch[store.opcode[row]]
+            target = store.target[row]
             if op._name == 'main':
-                self.operations[addr]._sub = 'main'
+                store[addr]._sub = 'main'
             elif op._call:
-                self.operations[op.jump_address]._sub = 'sub_{0:0>4X}'.format(op.jump_address)
-            elif op._jump and op.address != 0:
-                self.operations[op.jump_address]._loc = 'loc_{0:0>4X}'.format(op.jump_address)
+                store[target]._sub = 'sub_{0:0>4X}'.format(target)
+            elif op._jump and addr != 0:
+                store[target]._loc = 'loc_{0:0>4X}'.format(target)
 
     def split_subs(self):
         self.subs = {}
+        self.layout = []
         sub = None
-        sorted_ops = sorted(self.operations.items(), key=lambda i: i[0])
-        for idx, (addr, op) in enumerate(sorted_ops):
+        # only labelled operations have been built so far, keep it that way
+        views = self.operations.views
+        for addr in sorted(a for a, o in views.items() if o._sub):
+            op = views[addr]
             if op._sub:
-                if sub and sub.name != 'start':
-                    self.subs[sub.address] = sub
-                sub = GPCSub(self, op._sub, op.address, {})
+                if sub:
+                    sub.operations.end = addr
+                    if sub.name != 'start':
+                        self.subs[sub.address] = sub
+                sub = GPCSub(self, op._sub, op.address, self.index.range(addr))
+                self.layout.append(sub)
                 if sub.name == 'start':
                         self.start = sub
                 elif sub.name == 'init':
                     self.init = sub
                 elif sub.name == 'main':
                     self.main = sub
-            sub.operations[op.address] = op
         if sub:
             self.subs[sub.address] = sub
-        for idx, (addr, op) in enumerate(sorted_ops):
-            if op._call:
-                sub = self.subs[op.jump_address]
-                sub._pops = op.arguments[1]
-                sub._pushes = op.arguments[2]
+        store = self.operations
+        for addr in self.index.addresses:
+            row = store.rows[addr]
+            if store.opcode[row] != DATA and dispatch[store.opcode[row]]._call:
+                sub = self.subs[store.target[row]]
+                sub._pops = store.pops[row]
+                sub._pushes = store.pushes[row]
         if self.start:
             self.start.split_locs()
             self.start.resolve()
@@ -541,7 +1247,7 @@ class GPCDecoder(object):
         self.allocs = {}
         self.vars = {}
         if not self.init: return
-        for op in sorted(self.init.operations.values(), key=lambda o: o.address):
+        for op in self.init.operations.values():
             if op._name == 'alloc':
                 count = op.arguments[0]
                 if count > 1:
@@ -553,6 +1259,7 @@ class GPCDecoder(object):
                 total += count
         if self.allocs[0] % 3 == 0:
             self.combo_count = self.allocs[0] / 3
+        self.matcher = GPCComboMatcher(self.combo_count)
 
     def normalize_init(self):
         if not self.init: return
@@ -572,12 +1279,14 @@ class GPCDecoder(object):
     def renormalize_init(self):
         if not self.init: return
         self.alloc_values = {}
+        self.init_values = []
         for group in sorted(self.init.groups.values(), key=lambda g: g.address):
             if not hasattr(group.final_sink, 'operation'): continue
             if not group.simple(): break
             if group.final_sink.operation._name == 'pop':
                 var = group.final_sink.operation.arguments[0]
                 self.alloc_values[var] = group.final_sink.decompile(self)
+                self.init_values.append((var, group))
                 self.init.groups.pop(group.address)
             if group.final_sink.operation._name == 'T0':
                 self.t0 = group
@@ -590,33 +1299,51 @@ class GPCDecoder(object):
     def resolve(self):
         for sub in self.subs.values():
             if sub.name != 'init':
-                sub.split_locs()
-                sub.resolve()
+                sub.structure(self.memo)
+
+    def collect_sinks(self, groups, owner=None):
+        # owner is the address of the sub the groups belong to
+        for group in groups.values():
+            group.sinks = group.all_sinks()
+            for sink in group.sinks:
+                self.sinks[sink] = sink.sources.values()
+            self.flow.add(group.sinks, owner)
+
+    def drop_sinks(self, groups):
+        for group in groups.values():
+            for sink in group.sinks:
+                self.sinks.pop(sink, None)
+            self.flow.remove(group.sinks)
 
     def resolve_variables(self):
-        variables = {}
-        groups = {}
+        self.sinks = {}
+        self.flow = GPCDataflow()
         for sub in self.subs.values():
-            groups.update(sub.groups)
-        sinks = {}
-        for group in groups.values():
-            for sink in group.all_sinks():
-                sinks[sink] = sink.sources.values()
-        for sink, sources in sinks.items():
-            if not sink.operation._constants: continue
-            sources = sorted(sources, key=lambda s: s.address)
-            for sidx,source in enumerate(sources):
-                snkidx = sidx - len(sink.operation.arguments or [])
-                if snkidx >= len(sink.operation._constants) or not sink.operation._constants[snkidx]: continue
-                if not source.operation._variables: continue
-                if sidx >= len(source.operation._variables) or not source.operation._variables[sidx]: continue
-                arg = source.operation.arguments[0]
-                variables[arg] = sink.operation._constants[snkidx]
-        for sink, sources in sinks.items():
-            if not sink.operation._variables: continue
-            arg = sink.operation.arguments[0]
-            if variables.has_key(arg):
-                sink.operation._constants = (False, variables[arg],)
+            self.collect_sinks(sub.groups, sub.address)
+        self.infer_variables()
+
+    def infer_variables(self, only=None):
+        # types every variable, or only those in only, from the sinks so far:
+        # variables loaded straight into an operand taking named constants
+        # seed the typing, which then follows the copies between slots
+        if only is None:
+            self.variables = {}
+            seeds = self.flow.constants()
+        else:
+            seeds = self.flow.constants([('var', var) for var in only])
+        for key, constant in self.flow.solve(seeds).items():
+            if key[0] == 'var' and (only is None or key[1] in only):
+                self.variables[key[1]] = constant
+        if only is None:
+            self.apply_variables()
+
+    def invalidate(self):
+        self.symbols = object()
+
+    def apply_variables(self, sinks=None):
+        rule = GPCVariableTypes(self)
+        for sink in self.sinks if sinks is None else sinks:
+            rule.sink(sink)
 
     def split_combos(self):
         if not self.combo_count: return
@@ -636,105 +1363,87 @@ class GPCDecoder(object):
             outer_block = sorted(super_block.groups.values(), key=lambda g: g.address)[-1]
             inner_blocks = [b for b in sorted(outer_block.groups.values(), key=lambda g: g.address) if isinstance(b, GPCBlock)][2:]
             self.combos[idx] = GPCBlock(0, -1, {})
-            groups = {}
             for block in inner_blocks:
-                g = self.flatten_combo(idx, block)
-                groups.update(g)
-            for group in groups.values():
-                self.fix_combo_calls(group)
-                self.combos[idx].groups[group.address] = group
-            self.fix_combos(self.combos[idx])
+                self.combos[idx].groups.update(self.flatten_combo(idx, block))
+            # the calls inside and the combo fixes in one walk
+            GPCRewriter([GPCComboCalls(self.matcher), GPCComboFixes(self)]).run(self.combos[idx])
 
     def flatten_combo(self, idx, block):
+        # drops the state machine of combo idx, keeping what it runs
+        step, reset = self.matcher.machine(idx)
         groups = {}
-        expected = []
-        for i in range(3):
-            expected.append('v0[{0}]'.format(idx * 3 + i))
-        if isinstance(block, GPCBlock):
-            actual = sorted([s.decompile(self) for s in block._condition.final_sink.all_sources()])
-            if len(actual) == 2 and expected[2] == actual[1]:
-                for group in block.groups.values():
-                    groups.update(self.flatten_combo(idx, group))
-            else:
-                groups[block.address] = block
-        else:
-            actual = sorted([s.decompile(self) for s in block.final_sink.all_sources()])
-            if block.final_sink.operation._name == 'pop' and 'v0[{0}]'.format(block.final_sink.operation.arguments[0]) in expected and actual[0] == '0':
-                pass
-            elif len(actual) == 2 and expected[2] == actual[1]:
-                pass
-            else:
+        pending = [block]
+        while pending:
+            block = pending.pop()
+            if isinstance(block, GPCBlock):
+                if step.match(block._condition.final_sink):
+                    pending.extend(block.groups.values())
+                else:
+                    groups[block.address] = block
+            elif not reset.match(block.final_sink) and not step.match(block.final_sink):
                 groups[block.address] = block
         return groups
 
-    def fix_combo_calls(self, group):
-        if isinstance(group, GPCBlock):
-            for grp in group.groups.values():
-                self.fix_combo_calls(grp)
-        else:
-            valid = False
-            try:
-                op = group.final_sink.operation
-                srcop = group.final_sink.sources.values()[0].operation
-                valid = op._name == 'pop' and op.arguments[0] % 3 == 0 and srcop._name == 'pushi' and srcop.arguments[0] == 1
-            except: pass
-            if valid:
-                combo_index = op.arguments[0] / 3
-                group.final_sink = GPCFakeStackSink('call(combo{0})'.format(combo_index))
-            valid = False
-            try:
-                op = group.final_sink.operation
-                srcop = group.final_sink.sources.values()[0].operation
-                valid = op._name == 'pop' and (op.arguments[0] - 1) % 3 == 0 and srcop._name == 'mul'
-            except: pass
-            if valid:
-                group.final_sink = GPCFakeStackSink('')
-
     def fix_combos(self, block):
-        for group in sorted(block.groups.values(), key=lambda g: g.address):
-            if isinstance(group, GPCBlock):
-                self.fix_combos(group)
-            else:
-                op1valid = False
-                op2valid = False
-                op3valid = False
-                try:
-                    op1 = group.final_sink.operation
-                    srcop1 = group.final_sink.sources.values()[0].operation
-                    op1valid = op1._name == 'pop' and op1.arguments[0] % 3 == 0 and op1.arguments[0] < (self.combo_count * 3) and srcop1._name == 'pushi'
-                    op2 = group.next.final_sink.operation
-                    srcop2 = group.next.final_sink.sources.values()[0].operation
-                    op2valid = op2._name == 'pop' and (op2.arguments[0] - 1) % 3 == 0 and op2.arguments[0] < (self.combo_count * 3) and srcop2._name == 'pushi' and srcop2.arguments[0] == 0
-                    op3 = group.next.next.final_sink.operation
-                    srcop3 = group.next.next.final_sink.sources.values()[0].operation
-                    op3valid = op3._name == 'pop' and (op3.arguments[0] - 2) % 3 == 0 and op3.arguments[0] < (self.combo_count * 3) and srcop3._name == 'pushi' and srcop3.arguments[0] == 0
-                except: pass
-                if op1valid:
-                    combo_index = op1.arguments[0] / 3
-                    if op1valid and op2valid and op3valid:
-                        if srcop1.arguments[0] == 1:
-                            group.final_sink = GPCFakeStackSink('combo_restart(combo{0})'.format(combo_index))
-                        else:
-                            group.final_sink = GPCFakeStackSink('combo_stop(combo{0})'.format(combo_index))
-                        group.complex = True
-                        group.next.final_sink = GPCFakeStackSink('')
-                        group.next.complex = True
-                        group.next.next.final_sink = GPCFakeStackSink('')
-                        group.next.next.complex = True
-                    elif op1valid:
-                        group.final_sink = GPCFakeStackSink('combo_run(combo{0})'.format(combo_index))
-                for source in group.final_sink.all_sources():
-                    valid = False
-                    try:
-                        op = source.operation
-                        valid = op._name == 'push' and op.arguments[0] % 3 == 0 and op.arguments[0] < (self.combo_count * 3)
-                    except: pass
-                    if not valid: continue
-                    combo_index = op.arguments[0] / 3
-                    source._fake = 'combo_running(combo{0})'.format(combo_index)
+        GPCRewriter([GPCComboFixes(self)]).run(block)
 
     def fix_run_combo(self):
-        for sub in self.subs.values():
-            self.fix_combos(sub.root)
+        GPCRewriter([GPCComboFixes(self)]).run(*[sub.root for sub in self.subs.values()])
+
+class GPCVariableTypes(object):
+    # rewrite rule giving the final sinks that store or load a typed variable
+    # its named constants
+    def __init__(self, decoder):
+        self.decoder = decoder
+
+    def group(self, group):
+        self.sink(group.final_sink)
+
+    def sink(self, sink):
+        operation = getattr(sink, 'operation', None)
+        if operation is None or not operation._variables:
+            return
+        constant = self.decoder.variables.get(operation.arguments[0])
+        if constant is not None and operation._constants != (False, constant):
+            operation._constants = (False, constant)
+            self.decoder.invalidate()
+
+class GPCComboCalls(object):
+    # rewrite rule for the inside of a combo: call(combo) and the waits
+    def __init__(self, matcher):
+        self.matcher = matcher
 
+    def group(self, group):
+        if self.matcher.call.match(group.final_sink):
+            combo_index = group.final_sink.operation.arguments[0] / 3
+            group.final_sink = GPCFakeStackSink('call(combo{0})'.format(combo_index))
+        if self.matcher.wait.match(group.final_sink):
+            group.final_sink = GPCFakeStackSink('')
 
+class GPCComboFixes(object):
+    # rewrite rule putting back combo_run, combo_stop, combo_restart and
+    # combo_running where the compiler expanded them
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self.matcher = decoder.matcher
+
+    def group(self, group):
+        site = self.matcher.site(group)
+        if site is None:
+            return
+        kind, combo_index = site
+        group.final_sink = GPCFakeStackSink('combo_{0}(combo{1})'.format(kind, combo_index))
+        if kind != 'run':
+            group.complex = True
+            for other in (group.next, group.next.next):
+                other.final_sink = GPCFakeStackSink('')
+                other.complex = True
+
+    def leaf(self, leaf):
+        combo_index = self.matcher.running(leaf)
+        if combo_index is None:
+            return
+        fake = 'combo_running(combo{0})'.format(combo_index)
+        if leaf._fake != fake:
+            leaf._fake = fake
+            self.decoder.invalidate()
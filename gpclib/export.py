@@ -0,0 +1,146 @@
+import json
+from gpclib.opcodes import dispatch
+from gpclib.store import DATA
+from gpclib.visit import groups, is_block, nodes
+
+# bumped whenever a record changes shape
+version = 1
+
+# every record is a dict with a type, written out one at a time so a
+# consumer never needs more than the sub it is reading:
+#   image        once, first
+#   alloc, remap the variable and mapping segments
+#   sub          then the instructions, locs, groups and blocks of the sub,
+#                and for main the combos; every one of those has the sub
+#   instruction  operands as decoded, data as hex
+#   group        the stack expression of the final sink in post order, each
+#                node [address, op, operands, sources it takes off the list],
+#                and the code of sinks the combo fixes replaced
+#   block        children as ['g' or 'b', address] in address order
+#   error        a sub that could not be resolved, in place of its records
+def records(decoder):
+    lazy = 'lazy_decode' in decoder.done
+    if lazy and 'init_decode' not in decoder.done:
+        decoder.init_decode()
+    layout = sorted(decoder.layout, key=lambda s: s.address)
+
+    yield {
+        'type': 'image', 'version': version, 'size': len(decoder.data),
+        'instructions': len(decoder.operations), 'subs': len(layout),
+        'combos': decoder.combo_count, 't0': decoder.t0 is not None,
+    }
+    # a decode that failed early may not have got as far as these
+    values = getattr(decoder, 'alloc_values', {})
+    for index, count in sorted(getattr(decoder, 'allocs', {}).items()):
+        yield {'type': 'alloc', 'index': index, 'count': count, 'init': values.get(index)}
+    if decoder.maps:
+        for group in sorted(decoder.maps.groups.values(), key=lambda g: g.address):
+            operation = group.final_sink.operation
+            yield {'type': 'remap', 'address': group.address, 'op': operation._name,
+                'operands': list(operation.arguments or ())}
+
+    # anything decoded ahead of the first sub
+    start = layout[0].address if layout else None
+    for record in instructions(decoder, decoder.index.addresses, None, start):
+        yield record
+
+    for sub in layout:
+        if lazy and sub is not decoder.start:
+            try:
+                decoder.resolve_sub(sub.address)
+            except ValueError as e:
+                # one bad sub does not end the stream
+                yield {'type': 'error', 'sub': sub.address, 'message': str(e)}
+                decoder.release_sub(sub)
+                continue
+        yield {
+            'type': 'sub', 'address': sub.address, 'end': sub.operations.end, 'name': sub.name,
+            'pops': sub._pops, 'pushes': sub._pushes, 'prototype': sub.generate_prototype(),
+        }
+        for record in instructions(decoder, sub.operations.keys(), sub.address):
+            yield record
+        for loc in sorted(sub.locs.values(), key=lambda l: l.address):
+            yield {'type': 'loc', 'sub': sub.address, 'address': loc.address,
+                'end': loc.operations.end, 'groups': sorted(loc.groups)}
+        for group in sorted(sub.groups.values(), key=lambda g: g.address):
+            yield group_record(decoder, sub, group)
+        if getattr(sub, 'root', None) is not None:
+            for record in block_records(sub, sub.root):
+                yield record
+        if sub is decoder.main and decoder.combos:
+            for idx, combo in enumerate(decoder.combos):
+                yield {'type': 'combo', 'sub': sub.address, 'index': idx}
+                for record in block_records(sub, combo, idx):
+                    yield record
+        if lazy:
+            decoder.release_sub(sub)
+
+def instructions(decoder, addresses, sub, end=None):
+    store = decoder.operations
+    data = decoder.data
+    for address in addresses:
+        if end is not None and address >= end:
+            break
+        row = store.rows[address]
+        opcode = store.opcode[row]
+        size = store.size[row]
+        record = {'type': 'instruction', 'sub': sub, 'address': address, 'size': size}
+        if opcode == DATA:
+            record['op'] = 'data'
+            # a memoryview slice does not str to its bytes
+            record['bytes'] = bytes(bytearray(data[address:address + size])).encode('hex')
+        else:
+            op = dispatch[opcode]
+            record['op'] = op._name
+            record['operands'] = list(op._struct.unpack_from(data, address + 1)) if op._struct else []
+            record['pushes'] = store.pushes[row]
+            record['pops'] = store.pops[row]
+            if store.target[row] >= 0:
+                record['target'] = store.target[row]
+        yield record
+
+def group_record(decoder, sub, group):
+    sink = group.final_sink
+    record = {
+        'type': 'group', 'sub': sub.address, 'address': group.address, 'end': group.operations.end,
+        'jump': group._jump or None, 'jumpz': group._jumpz or None,
+        'opens': group._opens_block, 'closes': group._closes_block,
+    }
+    if hasattr(sink, 'operation'):
+        record['expr'] = [[node.address, node.operation._name, list(node.operation.arguments or ()),
+            len(getattr(node, 'sources', ()))] for node, depth in nodes(sink)]
+    else:
+        record['expr'] = []
+        record['code'] = sink.decompile(decoder)
+    return record
+
+def block_records(sub, root, combo=None):
+    parents = {}
+    for block in [root] + [g for g, depth in groups(root) if is_block(g)]:
+        record = {
+            'type': 'block', 'sub': sub.address, 'address': block.address,
+            'end': None if block.end == -1 else block.end,
+            'parent': parents.get(id(block)),
+            'condition': block._condition.address if block._condition else None,
+            'while': block._while, 'else': block._else,
+            'children': [],
+        }
+        if combo is not None:
+            record['combo'] = combo
+        for child in sorted(block.groups.values(), key=lambda g: g.address):
+            if is_block(child):
+                parents[id(child)] = block.address
+                record['children'].append(['b', child.address])
+            else:
+                record['children'].append(['g', child.address])
+        yield record
+
+def jsonl(decoder):
+    # sorting the keys would keep json off its C encoder
+    dumps = json.JSONEncoder(separators=(',', ':')).encode
+    for record in records(decoder):
+        yield dumps(record)
+
+def error(message):
+    # a decode error as the record a consumer of jsonl can tell apart
+    return json.dumps({'type': 'error', 'message': message}, separators=(',', ':'))
@@ -1,5 +1,51 @@
 import struct
-from gpclib.constants import *
+from gpclib.constants import BUTTONS, LEDS, PIO, PS4, PVARS, RUMBLE, SENS, TRUTHS
+
+# renderers by format, constants and variables, shared by every op with the
+# same ones; constants are keyed by identity and kept alive by the entry
+templates = {}
+unset = object()
+
+def compile_template(fmt, constants, variables):
+    # a renderer doing only the lookups this format, constants and variables
+    # need, called with the op, the decoder and the rendered sources
+    if fmt is None:
+        return lambda op, decoder, args: '// {0}'.format(op)
+    # string loads re, a disassembly never gets here
+    from string import Formatter
+    render = fmt.format
+    mapped = [(idx, const) for idx, const in enumerate(constants or ()) if const]
+    named = [idx for idx, is_var in enumerate(variables or ()) if is_var]
+    keyword = False
+    for text, name, spec, conversion in Formatter().parse(fmt):
+        if name and (name == 'd' or name.startswith('d.') or name.startswith('d[')):
+            keyword = True
+    if not mapped and not named:
+        if keyword:
+            return lambda op, decoder, args: render(*((op.arguments or ()) + tuple(args)), d=decoder)
+        return lambda op, decoder, args: render(*((op.arguments or ()) + tuple(args)))
+
+    def template(op, decoder, args):
+        a = list(op.arguments or ())
+        a.extend(args)
+        for idx, const in mapped:
+            if a[idx] in const:
+                a[idx] = const[a[idx]]
+        if named:
+            names = decoder.vars
+            for idx in named:
+                a[idx] = names[a[idx]]
+        if keyword:
+            return render(*a, d=decoder)
+        return render(*a)
+    return template
+
+def template(fmt, constants, variables):
+    key = (fmt, constants and tuple(id(c) for c in constants), variables)
+    entry = templates.get(key)
+    if entry is None:
+        entry = templates[key] = (constants, compile_template(fmt, constants, variables))
+    return entry[1]
 
 class OpCode(object):
     _op = -1
@@ -19,6 +65,14 @@ class OpCode(object):
     _simple = False
     _pops = 0
     _pushes = 0
+    _pops_argument = None
+    _pushes_argument = None
+    _struct = None
+    # the disassembly of the operands, compiled with the struct
+    _repr = None
+    # format and constants the template below was compiled for, kept on the
+    # class unless the op has its own
+    _template = (unset, unset, None)
     address = 0
     size = 0
 
@@ -30,71 +84,60 @@ class OpCode(object):
         self.size = 0
     
         # check for the correct op code
-        if data[address] != chr(self._op):
+        if opcode_struct.unpack_from(data, address)[0] != self._op:
             return self.size
         
+        # unpack the arguments
+        arguments = None
+        if self._struct is not None:
+            arguments = self._struct.unpack_from(data, address + 1)
+        
+        self.bind(address, arguments)
+        return self.size
+    
+    def bind(self, address, arguments):
         # store the address
         self.address = address
-        self.size = 1
+        self.size = lengths[self._op]
+        self.arguments = arguments
         
         # check for arguments
-        if self._arguments is None:
-            return self.size
-        
-        # unpack the arguments
-        args = '<' + ''.join(self._arguments)
-        self.arguments = struct.unpack_from(args, data, address + 1)
-        self.size += struct.calcsize(args)
+        if arguments is None:
+            return
         
         # store any jump or call
         if self._jump or self._call:
-            self.jump_address = self.arguments[self._target]
+            self.jump_address = arguments[self._target]
         
-        return self.size
-    
-    def _fmt_args(self):
-        if self.arguments is None:
-            return ''
-        if self._arguments_fmt is None:
-            raise NotImplementedError()
-        return self._arguments_fmt.format(*self.arguments)
+        # store a stack effect given by the arguments
+        if self._pops_argument is not None:
+            self._pops = arguments[self._pops_argument]
+        if self._pushes_argument is not None:
+            self._pushes = arguments[self._pushes_argument]
     
     def __repr__(self):
         if self._name is None:
             raise NotImplementedError()
-        args = self._fmt_args()
-        return '{0}\t{1}'.format(self._name, args)
+        if self.arguments is None:
+            return self._name + '\t'
+        if self._repr is None:
+            raise NotImplementedError()
+        return self._repr(*self.arguments)
 
     def decompile(self, decoder, *args):
-        if self._fmt_decompile is None:
-            return '// {0}'.format(self)
-        a = []
-        if self.arguments:
-            a.extend(self.arguments)
-        a.extend(args)
-        if self._constants:
-            for idx, const in enumerate(self._constants):
-                if const:
-                    if a[idx] in const:
-                        a[idx] = const[a[idx]]
-        if self._variables:
-            for idx, is_var in enumerate(self._variables):
-                if is_var:
-                    a[idx] = decoder.vars[a[idx]]
-        return self._fmt_decompile.format(*a, d=decoder)
+        return self.render(decoder, args)
+
+    def render(self, decoder, args):
+        # args are the rendered sources
+        fmt, constants, compiled = self._template
+        if fmt is not self._fmt_decompile or constants is not self._constants:
+            compiled = template(self._fmt_decompile, self._constants, self._variables)
+            own = '_fmt_decompile' in self.__dict__ or '_constants' in self.__dict__
+            setattr(self if own else type(self), '_template', (self._fmt_decompile, self._constants, compiled))
+        return compiled(self, decoder, args)
 
 class FailedOpCode(OpCode):
     _name = 'OP_'
-    def __init__(self, data, address, length):
-        super(FailedOpCode, self).__init__()
-        self.address = address
-        self.size = length
-        self._op = ord(data[address])
-        self._name += '{0:0>2X}'.format(self._op)
-        self.arguments = struct.unpack_from('<' + 'B' * (length - 1), data, address + 1)
-        self._arguments_fmt = ''
-        for i in range(0, (length - 1)):
-            self._arguments_fmt += '{' + '{0}'.format(i) + ':0>2X} '
 class DataOpCode(OpCode):
     _name = '.data'
     _bounded = True
@@ -103,651 +146,203 @@ class DataOpCode(OpCode):
         self.address = address
         self.size = length
         self.arguments = struct.unpack_from('<' + 'B' * (length ), data, address)
-        self._arguments_fmt = ''
-        data = []
-        for i in range(0, length):
-            self._arguments_fmt += '{' + '{0}'.format(i) + ':0>2X} '
-            data.append('{{{0}}}'.format(i))
-        self._fmt_decompile = 'data({0})'.format(', '.join(data))
+
+    def __repr__(self):
+        return '.data\t' + ('%02X ' * len(self.arguments)) % self.arguments
+
+    def render(self, decoder, args):
+        return 'data({0})'.format(', '.join([str(b) for b in self.arguments]))
 class HalfOpCode(OpCode):
     _arguments = ('B')
     _arguments_fmt = '{0:0>2X}'
 class TypicalOpCode(OpCode):
     _arguments = ('h')
     _arguments_fmt = '{0:0>4X}'
-class MainEndOpCode(OpCode):
-    _op = 0x00
-    _name = 'end'
-    _fmt_decompile = ''
-class RemapOpCode(TypicalOpCode):
-    _op = 0x02
-    _name = 'remap'
-    _arguments = ('B', 'B')
-    _constants = (BUTTONS, BUTTONS)
-    _arguments_fmt = '{0:0>2X} {1:0>2X}'
-    _fmt_decompile = 'remap {0} -> {1}'
-    _bounded = True
-    _simple = True
-class MainStartOpCode(OpCode):
-    _op = 0x01
-    _name = 'main'
-    _fmt_decompile = ''
-class AllocateOpCode(HalfOpCode):
-    _op = 0x03
-    _name = 'alloc'
-    _fmt_decompile = ''
-    _simple = True
-class PushOpCode(TypicalOpCode):
-    _op = 0x04
-    _name = 'push'
-    _arguments_fmt = 'var_{0:0>2X}'
-    _pushes = 1
-    _fmt_decompile = '{0}'
-    _variables = (True,)
-class PushImmediateOpCode(TypicalOpCode):
-    _op = 0x05
-    _name = 'pushi'
-    _arguments_fmt = '0x{0:X}'
-    _pushes = 1
-    _fmt_decompile = '{0}'
-    _simple = True
-class PopOpCode(TypicalOpCode):
-    _op = 0x06
-    _name = 'pop'
-    _arguments_fmt = 'var_{0:0>2X}'
-    _pops = 1
-    _fmt_decompile = '{0} = {1}'
-    _variables = (True,)
-    _bounded = True
-    _simple = True
-class WaitOpCode(TypicalOpCode):
-    _op = 0x07
-    _name = 'wait'
-    _pops = 1
-    _fmt_decompile = 'wait({1})'
-    _bounded = True
-class JumpOpCode(TypicalOpCode):
-    _op = 0x08
-    _name = 'jmp'
-    _jump = True
-    _target = 0
-    _arguments_fmt = 'loc_{0:0>4X}'
-    _fmt_decompile = ''
-class JumpZeroOpCode(TypicalOpCode):
-    _op = 0x09
-    _name = 'jmpz'
-    _jump = True
-    _conditional = True
-    _target = 0
-    _arguments_fmt = 'loc_{0:0>4X}'
-    _pops = 1
-    _fmt_decompile = 'if ({1})'
-    _constants = (False, TRUTHS)
-class AndOpCode(OpCode):
-    _op = 0x0A
-    _name = 'and'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} && {1}'
-class OrOpCode(OpCode):
-    _op = 0x0B
-    _name = 'or'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} || {1}'
-class EqualOpCode(OpCode):
-    _op = 0x0C
-    _name = 'eq'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} == {1}'
-class NotEqualOpCode(OpCode):
-    _op = 0x0D
-    _name = 'neq'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} != {1}'
-class LessThanOpCode(OpCode):
-    _op = 0x0E
-    _name = 'lt'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} < {1}'
-class LessThanEqualOpCode(OpCode):
-    _op = 0x0F
-    _name = 'lte'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} <= {1}'
-class GreaterThanOpCode(OpCode):
-    _op = 0x10
-    _name = 'gt'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} > {1}'
-class GreaterThanEqualOpCode(OpCode):
-    _op = 0x11
-    _name = 'gte'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} >= {1}'
-class AddOpCode(OpCode):
-    _op = 0x12
-    _name = 'add'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} + {1}'
-class SubtractOpCode(OpCode):
-    _op = 0x13
-    _name = 'sub'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} - {1}'
-class MultiplyOpCode(OpCode):
-    _op = 0x14
-    _name = 'mul'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} * {1}'
-class DivideOpCode(OpCode):
-    _op = 0x15
-    _name = 'div'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} / {1}'
-class NotOpCode(OpCode):
-    _op = 0x16
-    _name = 'not'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = '!{0}'
-    _constants = (TRUTHS,)
-class GetRtimeOpCode(OpCode):
-    _op = 0x17
-    _name = 'grtime'
-    _pushes = 1
-    _fmt_decompile = 'get_rtime()'
-class SetValOpCode(OpCode):
-    _op = 0x18
-    _name = 'sval'
-    _pops = 2
-    _fmt_decompile = 'set_val({0}, {1})'
-    _bounded = True
-    _constants = (BUTTONS,)
-class GetValOpCode(OpCode):
-    _op = 0x19
-    _name = 'gval'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'get_val({0})'
-    _bounded = True
-    _constants = (BUTTONS,)
-class GetLvalOpCode(OpCode):
-    _op = 0x1A
-    _name = 'glval'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'get_lval({0})'
-    _bounded = True
-    _constants = (BUTTONS,)
-class GetPtimeOpCode(OpCode):
-    _op = 0x1B
-    _name = 'gptime'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'get_ptime({0})'
-    _bounded = True
-    _constants = (BUTTONS,)
-class EventPressOpCode(OpCode):
-    _op = 0x1C
-    _name = 'eventpress'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'event_press({0})'
-    _bounded = True
-    _constants = (BUTTONS,)
-class EventReleaseOpCode(OpCode):
-    _op = 0x1D
-    _name = 'eventrelease'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'event_release({0})'
-    _bounded = True
-    _constants = (BUTTONS,)
-class TurnOffOpCode(OpCode):
-    _op = 0x1E
-    _name = 'turnoff'
-    _fmt_decompile = 'turn_off()'
-class SwapOpCode(OpCode):
-    _op = 0x1F
-    _name = 'swap'
-    _pops = 2
-    _fmt_decompile = 'swap({0}, {1})'
-    _bounded = True
-    _constants = (BUTTONS, BUTTONS)
-class BlockOpCode(OpCode):
-    _op = 0x20
-    _name = 'block'
-    _pops = 2
-    _fmt_decompile = 'block({0}, {1})'
-    _bounded = True
-    _constants = (BUTTONS,)
-class SensitivityOpCode(OpCode):
-    _op = 0x21
-    _name = 'sens'
-    _pops = 3
-    _fmt_decompile = 'sensitivity({0}, {1}, {2})'
-    _bounded = True
-    _constants = (BUTTONS, False, SENS)
-class SetLedOpCode(OpCode):
-    _op = 0x22
-    _name = 'sled'
-    _pops = 2
-    _fmt_decompile = 'set_led({0}, {1})'
-    _bounded = True
-    _constants = (LEDS,)
-class GetLedOpCode(OpCode):
-    _op = 0x23
-    _name = 'gled'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'get_led({0})'
-    _bounded = True
-    _constants = (LEDS,)
-class SetRumbleOpCode(OpCode):
-    _op = 0x24
-    _name = 'srumble'
-    _pops = 2
-    _fmt_decompile = 'set_rumble({0}, {1})'
-    _bounded = True
-    _constants = (RUMBLE,)
-class GetRumbleOpCode(OpCode):
-    _op = 0x25
-    _name = 'grumble'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'get_rumble({0})'
-    _bounded = True
-    _constants = (RUMBLE,)
-class LoadSlotOpCode(OpCode):
-    _op = 0x26
-    _name = 'loadslot'
-    _pops = 1
-    _fmt_decompile = 'load_slot({0})'
-    _bounded = True
-class AbsOpCode(OpCode):
-    _op = 0x27
-    _name = 'abs'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'abs({0})'
-    _bounded = True
-class ResetLedOpCode(OpCode):
-    _op = 0x28
-    _name = 'resetleds'
-    _fmt_decompile = 'reset_leds()'
-class BlockRumbleOpCode(OpCode):
-    _op = 0x29
-    _name = 'blockrumble'
-    _fmt_decompile = 'block_rumble()'
-class ResetRumbleOpCode(OpCode):
-    _op = 0x2A
-    _name = 'resetrumble'
-    _fmt_decompile = 'reset_rumble()'
-class VmtCtrlOpCode(OpCode):
-    _op = 0x2B
-    _name = 'vmtctrl'
-    _pops = 1
-    _fmt_decompile = 'vm_tctrl({0})'
-    _bounded = True
-class InverseOpCode(OpCode):
-    _op = 0x2C
-    _name = 'inv'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'inv({0})'
-    _bounded = True
-class WiirOffScreenOpCode(OpCode):
-    _op = 0x2D
-    _name = 'wroscr'
-    _pushes = 1
-    _fmt_decompile = 'wiir_offscreen()'
-class PowOpCode(OpCode):
-    _op = 0x2E
-    _name = 'pow'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = 'pow({0}, {1})'
-    _bounded = True
-class IntSqrtOpCode(OpCode):
-    _op = 0x2F
-    _name = 'isqrt'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'isqrt({0})'
-    _bounded = True
-class StickizeOpCode(OpCode):
-    _op = 0x30
-    _name = 'stickize'
-    _pops = 3
-    _fmt_decompile = 'stickize({0}, {1}, {2})'
-    _constants = (BUTTONS, BUTTONS)
-    _bounded = True
-class UnmapOpCode(HalfOpCode):
-    _op = 0x31
-    _name = 'unmap'
-    _fmt_decompile = 'unmap {0}'
-    _constants = (BUTTONS,)
-    _bounded = True
-class DeadZoneOpCode(OpCode):
-    _op = 0x32
-    _name = 'dzone'
-    _pops = 4
-    _fmt_decompile = 'deadzone({0}, {1}, {2}, {3})'
-    _constants = (BUTTONS, BUTTONS)
-    _bounded = True
-class ModulusOpCode(OpCode):
-    _op = 0x33
-    _name = 'mod'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} % {1}'
-class SetPvarOpCode(OpCode):
-    _op = 0x34
-    _name = 'spvar'
-    _pops = 2
-    _fmt_decompile = 'set_pvar({0}, {1})'
-    _bounded = True
-    _constants = (PVARS,)
-class GetPvarOpCode(OpCode):
-    _op = 0x35
-    _name = 'gpvar'
-    _pops = 4
-    _pushes = 1
-    _fmt_decompile = 'get_pvar({0}, {1}, {2}, {3})'
-    _bounded = True
-    _constants = (PVARS,)
 class CallOpCode(OpCode):
     _op = 0x36
     _name = 'call'
     _call = True
     _target = 0
-    _arguments = ('h', 'B', 'B')
+    _arguments = ('H', 'B', 'B')
     _arguments_fmt = 'sub_{0:0>4X} {1:0>2X} {2:0>2X}'
     _fmt_decompile = 'sub_{0:0>4X}('
     _bounded = True
+    _pops_argument = 1
+    _pushes_argument = 2
+    # formats by number of arguments, shared by every call with as many
+    _fmt_calls = {}
     
-    def parse(self, data, address):
-        l = super(CallOpCode, self).parse(data, address)
-        if l > 0:
-            self._pops = self.arguments[1]
-            self._pushes = self.arguments[2]
+    def bind(self, address, arguments):
+        super(CallOpCode, self).bind(address, arguments)
+        fmt = self._fmt_calls.get(self._pops)
+        if fmt is None:
             args = []
             for i in range(self._pops):
                 args.append('{{{0}}}'.format(i + 3))
-            self._fmt_decompile = self._fmt_decompile + ', '.join(args) + ')'
-        return l
+            fmt = self._fmt_calls[self._pops] = CallOpCode._fmt_decompile + ', '.join(args) + ')'
+        self._fmt_decompile = fmt
 class RetOpCode(HalfOpCode):
     _op = 0x37
     _name = 'ret'
     _fmt_decompile = 'return'
     _bounded = True
-    def parse(self, data, address):
-        l = super(RetOpCode, self).parse(data, address)
-        if l > 0:
-            self._pops = self.arguments[0]
-            if self._pops:
-                self._fmt_decompile = 'return {1}'
-        return l
-class PushArgumentOpCode(TypicalOpCode):
-    _op = 0x38
-    _name = 'pusha'
-    _arguments_fmt = 'a{0}'
-    _pushes = 1
-    _fmt_decompile = 'a{0}'
-class PopArgumentOpCode(TypicalOpCode):
-    _op = 0x39
-    _name = 'popa'
-    _arguments_fmt = 'a{0}'
-    _pops = 1
-    _fmt_decompile = 'a{0} = {1}'
-class SetLedxOpCode(OpCode):
-    _op = 0x3A
-    _name = 'sledx'
-    _pops = 2
-    _fmt_decompile = 'set_ledx({0}, {1})'
-    _bounded = True
-    _constants = (LEDS,)
-class GetLedxOpCode(OpCode):
-    _op = 0x3B
-    _name = 'gledx'
-    _pushes = 1
-    _fmt_decompile = 'get_ledx()'
-class GetConsoleOpCode(OpCode):
-    _op = 0x3C
-    _name = 'gcnsl'
-    _pushes = 1
-    _fmt_decompile = 'get_console()'
-    _ret_constants = PIO
-class GetControllerOpCode(OpCode):
-    _op = 0x3D
-    _name = 'gctrl'
-    _pushes = 1
-    _fmt_decompile = 'get_controller()'
-    _ret_constants = PIO
-class XorOpCode(OpCode):
-    _op = 0x3E
-    _name = 'xor'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = '{0} ^^ {1}'
-class PushIndexedOpCode(TypicalOpCode):
-    _op = 0x3F
-    _name = 'pushidx'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = '{0}[{1}]'
-    _variables = (True,)
-class PopIndexedOpCode(TypicalOpCode):
-    _op = 0x40
-    _name = 'popidx'
-    _pops = 2
-    _fmt_decompile = '{0}[{1}] = {2}'
-    _variables = (True,)
-class GetSlotOpCode(OpCode):
-    _op = 0x41
-    _name = 'getslot'
-    _pushes = 1
-    _fmt_decompile = 'get_slot()'
-class SetBitOpCode(TypicalOpCode):
-    _op = 0x42
-    _name = 'sbit'
-    _arguments_fmt = 'var_{0:0>2X}'
-    _pops = 1
-    _variables = (True,)
-    _fmt_decompile = 'set_bit({1}, {0})'
-class ClearBitOpCode(TypicalOpCode):
-    _op = 0x43
-    _name = 'cbit'
-    _arguments_fmt = 'var_{0:0>2X}'
-    _pops = 1
-class TestBitOpCode(OpCode):
-    _op = 0x44
-    _name = 'tbit'
-    _pops = 2
-    _pushes = 1
-    _fmt_decompile = 'test_bit({0}, {1})'
-class SetBitsOpCode(TypicalOpCode):
-    _op = 0x45
-    _name = 'sbits'
-    _arguments_fmt = 'var_{0:0>2X}'
-    _pops = 3
-    _variables = (True,)
-    _fmt_decompile = 'set_bits({0}, {1}, {2}, {3})'
-class GetBitsOpCode(OpCode):
-    _op = 0x46
-    _name = 'gbits'
-    _pops = 3
-    _pushes = 1
-    _fmt_decompile = 'get_bits({0}, {1}, {2})'
-class DataCharOpCode(OpCode):
-    _op = 0x47
-    _name = 'dchar'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'dchar({0})'
-    _bounded = True
-class DataByteOpCode(OpCode):
-    _op = 0x48
-    _name = 'dbyte'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'dbyte({0})'
-    _bounded = True
-class DataWordOpCode(OpCode):
-    _op = 0x49
-    _name = 'dword'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'dword({0})'
-    _bounded = True
-class SetBitArgumentOpCode(TypicalOpCode):
-    _op = 0x4A
-    _name = 'sbita'
-    _arguments_fmt = 'arg_{0:X}'
-    _pops = 1
-    _fmt_decompile = 'set_bit(a{0}, {1})'
-class ClearBitArgumentOpCode(TypicalOpCode):
-    _op = 0x4B
-    _name = 'cbita'
-    _arguments_fmt = 'arg_{0:X}'
-    _pops = 1
-    _fmt_decompile = 'clear_bit(a{0}, {1})'
-class SetBitsArgumentOpCode(TypicalOpCode):
-    _op = 0x4C
-    _name = 'sbitsa'
-    _arguments_fmt = 'arg_{0:X}'
-    _pops = 3
-    _fmt_decompile = 'set_bits(a{0}, {1}, {2}, {3})'
-class Ps4TouchOpCode(TypicalOpCode):
-    _op = 0x4D
-    _name = 'ps4tch'
-    _pops = 1
-    _pushes = 1
-    _fmt_decompile = 'ps4_touchpad({0})'
-    _bounded = True
-    _constants = (PS4,)
-class GetBatteryOpCode(OpCode):
-    _op = 0x4E
-    _name = 'gbatt'
-    _pushes = 1
-    _fmt_decompile = 'get_battery()'
-class NopOpCode(OpCode):
-    _op = 0x4F
-    _name = 'T0'
-    _fmt_decompile = 'T0'
-    _simple = True
-class GetPS4AuthTimeOutOpCode(OpCode):
-    _op = 0x50
-    _name = 'GetPS4AuthTimeout'
-    _pushes = 1
-    _fmt_decompile = 'ps4_authtimeout()'
-class PS4OutReConnOpCode(OpCode):
-    _op = 0x51
-    _name = 'op_reconn'
-    _fmt_decompile = 'output_reconnection()'
-class GetCtrlBtnOpCode(OpCode):
-    _op = 0x52
-    _name = 'GetCtrlBtnOpCode'
-    _pushes = 1
-    _fmt_decompile = 'get_ctrlbutton()'
+    _pops_argument = 0
+    def bind(self, address, arguments):
+        super(RetOpCode, self).bind(address, arguments)
+        if self._pops:
+            self._fmt_decompile = 'return {1}'
 
+# every op but the two above as op code, class, mnemonic, base, pops, pushes,
+# decompiled form and flags (b bounded, s simple, v a variable in the first
+# operand, j jumps to its only operand, a loc, c only if what it pops is
+# false), then any other class attributes it has, the operand format being
+# that of the base unless given; the classes and their renderers are made
+# from these rows by load()
+spec = (
+    (0x00, 'MainEndOpCode', 'end', OpCode, 0, 0, '', ''),
+    (0x01, 'MainStartOpCode', 'main', OpCode, 0, 0, '', ''),
+    (0x02, 'RemapOpCode', 'remap', TypicalOpCode, 0, 0, 'remap {0} -> {1}', 'bs',
+        {'_arguments': 'BB', '_arguments_fmt': '{0:0>2X} {1:0>2X}', '_constants': (BUTTONS, BUTTONS)}),
+    (0x03, 'AllocateOpCode', 'alloc', HalfOpCode, 0, 0, '', 's'),
+    (0x04, 'PushOpCode', 'push', TypicalOpCode, 0, 1, '{0}', 'v', {'_arguments_fmt': 'var_{0:0>2X}'}),
+    (0x05, 'PushImmediateOpCode', 'pushi', TypicalOpCode, 0, 1, '{0}', 's', {'_arguments_fmt': '0x{0:X}'}),
+    (0x06, 'PopOpCode', 'pop', TypicalOpCode, 1, 0, '{0} = {1}', 'bsv', {'_arguments_fmt': 'var_{0:0>2X}'}),
+    (0x07, 'WaitOpCode', 'wait', TypicalOpCode, 1, 0, 'wait({1})', 'b'),
+    (0x08, 'JumpOpCode', 'jmp', TypicalOpCode, 0, 0, '', 'j'),
+    (0x09, 'JumpZeroOpCode', 'jmpz', TypicalOpCode, 1, 0, 'if ({1})', 'jc', {'_constants': (False, TRUTHS)}),
+    (0x0A, 'AndOpCode', 'and', OpCode, 2, 1, '{0} && {1}', ''),
+    (0x0B, 'OrOpCode', 'or', OpCode, 2, 1, '{0} || {1}', ''),
+    (0x0C, 'EqualOpCode', 'eq', OpCode, 2, 1, '{0} == {1}', ''),
+    (0x0D, 'NotEqualOpCode', 'neq', OpCode, 2, 1, '{0} != {1}', ''),
+    (0x0E, 'LessThanOpCode', 'lt', OpCode, 2, 1, '{0} < {1}', ''),
+    (0x0F, 'LessThanEqualOpCode', 'lte', OpCode, 2, 1, '{0} <= {1}', ''),
+    (0x10, 'GreaterThanOpCode', 'gt', OpCode, 2, 1, '{0} > {1}', ''),
+    (0x11, 'GreaterThanEqualOpCode', 'gte', OpCode, 2, 1, '{0} >= {1}', ''),
+    (0x12, 'AddOpCode', 'add', OpCode, 2, 1, '{0} + {1}', ''),
+    (0x13, 'SubtractOpCode', 'sub', OpCode, 2, 1, '{0} - {1}', ''),
+    (0x14, 'MultiplyOpCode', 'mul', OpCode, 2, 1, '{0} * {1}', ''),
+    (0x15, 'DivideOpCode', 'div', OpCode, 2, 1, '{0} / {1}', ''),
+    (0x16, 'NotOpCode', 'not', OpCode, 1, 1, '!{0}', '', {'_constants': (TRUTHS,)}),
+    (0x17, 'GetRtimeOpCode', 'grtime', OpCode, 0, 1, 'get_rtime()', ''),
+    (0x18, 'SetValOpCode', 'sval', OpCode, 2, 0, 'set_val({0}, {1})', 'b', {'_constants': (BUTTONS,)}),
+    (0x19, 'GetValOpCode', 'gval', OpCode, 1, 1, 'get_val({0})', 'b', {'_constants': (BUTTONS,)}),
+    (0x1A, 'GetLvalOpCode', 'glval', OpCode, 1, 1, 'get_lval({0})', 'b', {'_constants': (BUTTONS,)}),
+    (0x1B, 'GetPtimeOpCode', 'gptime', OpCode, 1, 1, 'get_ptime({0})', 'b', {'_constants': (BUTTONS,)}),
+    (0x1C, 'EventPressOpCode', 'eventpress', OpCode, 1, 1, 'event_press({0})', 'b', {'_constants': (BUTTONS,)}),
+    (0x1D, 'EventReleaseOpCode', 'eventrelease', OpCode, 1, 1, 'event_release({0})', 'b', {'_constants': (BUTTONS,)}),
+    (0x1E, 'TurnOffOpCode', 'turnoff', OpCode, 0, 0, 'turn_off()', ''),
+    (0x1F, 'SwapOpCode', 'swap', OpCode, 2, 0, 'swap({0}, {1})', 'b', {'_constants': (BUTTONS, BUTTONS)}),
+    (0x20, 'BlockOpCode', 'block', OpCode, 2, 0, 'block({0}, {1})', 'b', {'_constants': (BUTTONS,)}),
+    (0x21, 'SensitivityOpCode', 'sens', OpCode, 3, 0, 'sensitivity({0}, {1}, {2})', 'b', {'_constants': (BUTTONS, False, SENS)}),
+    (0x22, 'SetLedOpCode', 'sled', OpCode, 2, 0, 'set_led({0}, {1})', 'b', {'_constants': (LEDS,)}),
+    (0x23, 'GetLedOpCode', 'gled', OpCode, 1, 1, 'get_led({0})', 'b', {'_constants': (LEDS,)}),
+    (0x24, 'SetRumbleOpCode', 'srumble', OpCode, 2, 0, 'set_rumble({0}, {1})', 'b', {'_constants': (RUMBLE,)}),
+    (0x25, 'GetRumbleOpCode', 'grumble', OpCode, 1, 1, 'get_rumble({0})', 'b', {'_constants': (RUMBLE,)}),
+    (0x26, 'LoadSlotOpCode', 'loadslot', OpCode, 1, 0, 'load_slot({0})', 'b'),
+    (0x27, 'AbsOpCode', 'abs', OpCode, 1, 1, 'abs({0})', 'b'),
+    (0x28, 'ResetLedOpCode', 'resetleds', OpCode, 0, 0, 'reset_leds()', ''),
+    (0x29, 'BlockRumbleOpCode', 'blockrumble', OpCode, 0, 0, 'block_rumble()', ''),
+    (0x2A, 'ResetRumbleOpCode', 'resetrumble', OpCode, 0, 0, 'reset_rumble()', ''),
+    (0x2B, 'VmtCtrlOpCode', 'vmtctrl', OpCode, 1, 0, 'vm_tctrl({0})', 'b'),
+    (0x2C, 'InverseOpCode', 'inv', OpCode, 1, 1, 'inv({0})', 'b'),
+    (0x2D, 'WiirOffScreenOpCode', 'wroscr', OpCode, 0, 1, 'wiir_offscreen()', ''),
+    (0x2E, 'PowOpCode', 'pow', OpCode, 2, 1, 'pow({0}, {1})', 'b'),
+    (0x2F, 'IntSqrtOpCode', 'isqrt', OpCode, 1, 1, 'isqrt({0})', 'b'),
+    (0x30, 'StickizeOpCode', 'stickize', OpCode, 3, 0, 'stickize({0}, {1}, {2})', 'b', {'_constants': (BUTTONS, BUTTONS)}),
+    (0x31, 'UnmapOpCode', 'unmap', HalfOpCode, 0, 0, 'unmap {0}', 'b', {'_constants': (BUTTONS,)}),
+    (0x32, 'DeadZoneOpCode', 'dzone', OpCode, 4, 0, 'deadzone({0}, {1}, {2}, {3})', 'b', {'_constants': (BUTTONS, BUTTONS)}),
+    (0x33, 'ModulusOpCode', 'mod', OpCode, 2, 1, '{0} % {1}', ''),
+    (0x34, 'SetPvarOpCode', 'spvar', OpCode, 2, 0, 'set_pvar({0}, {1})', 'b', {'_constants': (PVARS,)}),
+    (0x35, 'GetPvarOpCode', 'gpvar', OpCode, 4, 1, 'get_pvar({0}, {1}, {2}, {3})', 'b', {'_constants': (PVARS,)}),
+    (0x38, 'PushArgumentOpCode', 'pusha', TypicalOpCode, 0, 1, 'a{0}', '', {'_arguments_fmt': 'a{0}'}),
+    (0x39, 'PopArgumentOpCode', 'popa', TypicalOpCode, 1, 0, 'a{0} = {1}', '', {'_arguments_fmt': 'a{0}'}),
+    (0x3A, 'SetLedxOpCode', 'sledx', OpCode, 2, 0, 'set_ledx({0}, {1})', 'b', {'_constants': (LEDS,)}),
+    (0x3B, 'GetLedxOpCode', 'gledx', OpCode, 0, 1, 'get_ledx()', ''),
+    (0x3C, 'GetConsoleOpCode', 'gcnsl', OpCode, 0, 1, 'get_console()', '', {'_ret_constants': PIO}),
+    (0x3D, 'GetControllerOpCode', 'gctrl', OpCode, 0, 1, 'get_controller()', '', {'_ret_constants': PIO}),
+    (0x3E, 'XorOpCode', 'xor', OpCode, 2, 1, '{0} ^^ {1}', ''),
+    (0x3F, 'PushIndexedOpCode', 'pushidx', TypicalOpCode, 1, 1, '{0}[{1}]', 'v'),
+    (0x40, 'PopIndexedOpCode', 'popidx', TypicalOpCode, 2, 0, '{0}[{1}] = {2}', 'v'),
+    (0x41, 'GetSlotOpCode', 'getslot', OpCode, 0, 1, 'get_slot()', ''),
+    (0x42, 'SetBitOpCode', 'sbit', TypicalOpCode, 1, 0, 'set_bit({1}, {0})', 'v', {'_arguments_fmt': 'var_{0:0>2X}'}),
+    (0x43, 'ClearBitOpCode', 'cbit', TypicalOpCode, 1, 0, None, '', {'_arguments_fmt': 'var_{0:0>2X}'}),
+    (0x44, 'TestBitOpCode', 'tbit', OpCode, 2, 1, 'test_bit({0}, {1})', ''),
+    (0x45, 'SetBitsOpCode', 'sbits', TypicalOpCode, 3, 0, 'set_bits({0}, {1}, {2}, {3})', 'v', {'_arguments_fmt': 'var_{0:0>2X}'}),
+    (0x46, 'GetBitsOpCode', 'gbits', OpCode, 3, 1, 'get_bits({0}, {1}, {2})', ''),
+    (0x47, 'DataCharOpCode', 'dchar', OpCode, 1, 1, 'dchar({0})', 'b'),
+    (0x48, 'DataByteOpCode', 'dbyte', OpCode, 1, 1, 'dbyte({0})', 'b'),
+    (0x49, 'DataWordOpCode', 'dword', OpCode, 1, 1, 'dword({0})', 'b'),
+    (0x4A, 'SetBitArgumentOpCode', 'sbita', TypicalOpCode, 1, 0, 'set_bit(a{0}, {1})', '', {'_arguments_fmt': 'arg_{0:X}'}),
+    (0x4B, 'ClearBitArgumentOpCode', 'cbita', TypicalOpCode, 1, 0, 'clear_bit(a{0}, {1})', '', {'_arguments_fmt': 'arg_{0:X}'}),
+    (0x4C, 'SetBitsArgumentOpCode', 'sbitsa', TypicalOpCode, 3, 0, 'set_bits(a{0}, {1}, {2}, {3})', '', {'_arguments_fmt': 'arg_{0:X}'}),
+    (0x4D, 'Ps4TouchOpCode', 'ps4tch', TypicalOpCode, 1, 1, 'ps4_touchpad({0})', 'b', {'_constants': (PS4,)}),
+    (0x4E, 'GetBatteryOpCode', 'gbatt', OpCode, 0, 1, 'get_battery()', ''),
+    (0x4F, 'NopOpCode', 'T0', OpCode, 0, 0, 'T0', 's'),
+    (0x50, 'GetPS4AuthTimeOutOpCode', 'GetPS4AuthTimeout', OpCode, 0, 1, 'ps4_authtimeout()', ''),
+    (0x51, 'PS4OutReConnOpCode', 'op_reconn', OpCode, 0, 0, 'output_reconnection()', ''),
+    (0x52, 'GetCtrlBtnOpCode', 'GetCtrlBtnOpCode', OpCode, 0, 1, 'get_ctrlbutton()', ''),
+)
+
+def _build_ops():
+    ops = [CallOpCode, RetOpCode]
+    for row in spec:
+        opcode, name, mnemonic, base, pops, pushes, fmt, flags = row[:8]
+        attrs = {
+            '_op': opcode, '_name': mnemonic, '_pops': pops, '_pushes': pushes, '_fmt_decompile': fmt,
+            '_bounded': 'b' in flags, '_simple': 's' in flags, '_variables': (True,) if 'v' in flags else None,
+            '_jump': 'j' in flags, '_conditional': 'c' in flags,
+        }
+        if 'j' in flags:
+            attrs.update(_target=0, _arguments='H', _arguments_fmt='loc_{0:0>4X}')
+        attrs.update(row[8] if len(row) > 8 else {})
+        op = globals()[name] = type(name, (base,), attrs)
+        ops.append(op)
+    return sorted(ops, key=lambda op: op._op)
 
 missing = {
 }
 
-opcodes = [
-    MainEndOpCode,
-    RemapOpCode,
-    MainStartOpCode,
-    AllocateOpCode,
-    PushImmediateOpCode,
-    PushOpCode,
-    PopOpCode,
-    WaitOpCode,
-    JumpOpCode,
-    JumpZeroOpCode,
-    AndOpCode,
-    OrOpCode,
-    EqualOpCode,
-    NotEqualOpCode,
-    LessThanOpCode,
-    LessThanEqualOpCode,
-    GreaterThanOpCode,
-    GreaterThanEqualOpCode,
-    AddOpCode,
-    SubtractOpCode,
-    MultiplyOpCode,
-    DivideOpCode,
-    NotOpCode,
-    GetRtimeOpCode,
-    SetValOpCode,
-    GetValOpCode,
-    GetLvalOpCode,
-    GetPtimeOpCode,
-    EventPressOpCode,
-    EventReleaseOpCode,
-    TurnOffOpCode,
-    SwapOpCode,
-    BlockOpCode,
-    SensitivityOpCode,
-    SetLedOpCode,
-    GetLedOpCode,
-    SetRumbleOpCode,
-    GetRumbleOpCode,
-    LoadSlotOpCode,
-    AbsOpCode,
-    ResetLedOpCode,
-    BlockRumbleOpCode,
-    ResetRumbleOpCode,
-    VmtCtrlOpCode,
-    InverseOpCode,
-    WiirOffScreenOpCode,
-    PowOpCode,
-    IntSqrtOpCode,
-    StickizeOpCode,
-    UnmapOpCode,
-    DeadZoneOpCode,
-    ModulusOpCode,
-    SetPvarOpCode,
-    GetPvarOpCode,
-    CallOpCode,
-    RetOpCode,
-    PushArgumentOpCode,
-    PopArgumentOpCode,
-    SetLedxOpCode,
-    GetLedxOpCode,
-    GetConsoleOpCode,
-    GetControllerOpCode,
-    XorOpCode,
-    PushIndexedOpCode,
-    PopIndexedOpCode,
-    GetSlotOpCode,
-    SetBitOpCode,
-    ClearBitOpCode,
-    TestBitOpCode,
-    SetBitsOpCode,
-    GetBitsOpCode,
-    DataCharOpCode,
-    DataByteOpCode,
-    DataWordOpCode,
-    SetBitArgumentOpCode,
-    ClearBitArgumentOpCode,
-    SetBitsArgumentOpCode,
-    Ps4TouchOpCode,
-    GetBatteryOpCode,
-    NopOpCode,
-    GetPS4AuthTimeOutOpCode,
-    PS4OutReConnOpCode,
-    GetCtrlBtnOpCode
-]
+# the op code byte leading every instruction
+opcode_struct = struct.Struct('<B')
+
+# every op class by op code, and the decode tables indexed by the op code
+# byte; empty until load() fills them in place the first time a decoder is
+# made, so a script that never decodes never builds the classes
+opcodes = []
+dispatch = [None] * 256
+lengths = [0] * 256
+
+def _compile(op):
+    if op._arguments is not None:
+        op._struct = struct.Struct('<' + ''.join(op._arguments))
+    # mnemonic and operands in one format, for __repr__
+    if op._name is not None and op._arguments_fmt is not None:
+        op._repr = (op._name.replace('{', '{{').replace('}', '}}') + '\t' + op._arguments_fmt).format
+    return op
+
+def _build_tables(ops):
+    for op in ops:
+        dispatch[op._op] = _compile(op)
+
+    # op codes we know the length of but not the meaning
+    for opcode, length in missing.items():
+        fmt = ''
+        for i in range(0, (length - 1)):
+            fmt += '{' + '{0}'.format(i) + ':0>2X} '
+        dispatch[opcode] = _compile(type('FailedOpCode{0:0>2X}'.format(opcode), (FailedOpCode,), {
+            '_op': opcode,
+            '_name': 'OP_{0:0>2X}'.format(opcode),
+            '_arguments': 'B' * (length - 1) or None,
+            '_arguments_fmt': fmt,
+            }))
+
+    for opcode, op in enumerate(dispatch):
+        if op is not None:
+            lengths[opcode] = 1 + (op._struct.size if op._struct else 0)
+
+def load():
+    # the tables are complete once opcodes is filled
+    if not opcodes:
+        ops = _build_ops()
+        _build_tables(ops)
+        opcodes.extend(ops)
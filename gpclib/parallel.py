@@ -0,0 +1,78 @@
+import os
+
+# images with fewer instructions than this are done serially, forking the
+# workers costs more than resolving the subs of a small image
+threshold = 20000
+
+# the decoder the workers of the pool being made are forked from, each
+# worker has its own copy and only addresses go over the pipe
+decoder = None
+
+def worth(owner, subs):
+    # workers inherit the decoder, so only where processes are forked
+    return (owner.manager.jobs > 1 and len(subs) > 1 and hasattr(os, 'fork')
+        and len(owner.operations) >= threshold)
+
+def bodies(owner, subs):
+    # the decompiled lines of every sub, in the order given, or None if the
+    # image is not worth a pool and the caller should do them itself
+    if not worth(owner, subs):
+        return None
+    return GPCBodies(owner, [sub.address for sub in subs])
+
+class GPCBodies(object):
+    # workers forked right away resolve, decompile and release the subs at
+    # the addresses while the caller goes on; results come back in order
+    # whatever order the workers finish in, the workers go once all are in
+    # or when the caller closes or drops this early
+    def __init__(self, owner, addresses):
+        global decoder
+        self.pool = None
+        self.manager = owner.manager
+        self.left = len(addresses)
+        jobs = min(self.manager.jobs, len(addresses))
+        # only loaded once there is a pool to make, it is slow to import
+        import multiprocessing
+        decoder = owner
+        try:
+            self.pool = multiprocessing.Pool(jobs)
+        finally:
+            decoder = None
+        self.results = self.pool.imap(render, addresses, max(1, len(addresses) // (jobs * 8)))
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        body, report = next(self.results)
+        self.left -= 1
+        if report:
+            self.manager.merge(report)
+        if not self.left:
+            self.close()
+        return body
+
+    def close(self):
+        pool, self.pool = self.pool, None
+        if pool is None:
+            return
+        if self.left:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+    def __del__(self):
+        self.close()
+
+def render(address):
+    # the stats the worker was forked with belong to the parent, report
+    # only what this sub adds
+    manager = decoder.manager
+    if manager.stats is not None:
+        manager.stats = {}
+        manager.order = []
+    sub = decoder.resolve_sub(address)
+    body = list(sub.decompile())
+    decoder.release_sub(sub)
+    return body, manager.stats is not None and manager.report()
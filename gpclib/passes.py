@@ -0,0 +1,124 @@
+import sys
+import time
+
+# every decoder pass and the passes that must have run before it
+passes = {
+    'decode': (),
+    'fill_gaps': ('decode',),
+    'generate_labels': ('fill_gaps',),
+    'split_subs': ('generate_labels',),
+    'resolve_allocs': ('split_subs',),
+    'normalize_init': ('resolve_allocs',),
+    'resolve': ('normalize_init',),
+    'resolve_variables': ('resolve',),
+    'split_combos': ('resolve_variables',),
+    'resolve_combos': ('split_combos',),
+    'fix_run_combo': ('resolve_combos',),
+    'resolve_init': ('normalize_init',),
+    'renormalize_init': ('resolve_init',),
+    'lazy_init': ('normalize_init',),
+    'find_typers': ('lazy_init',),
+}
+
+# the passes each GPCDecoder entry point runs, in order
+pipelines = {
+    'full_decode': ('decode', 'fill_gaps', 'generate_labels', 'split_subs', 'resolve_allocs',
+        'normalize_init', 'resolve', 'resolve_variables'),
+    'combo_decode': ('split_combos', 'resolve_combos', 'fix_run_combo'),
+    'init_decode': ('resolve_init', 'renormalize_init'),
+    'lazy_decode': ('decode', 'fill_gaps', 'generate_labels', 'split_subs', 'resolve_allocs',
+        'normalize_init', 'lazy_init', 'find_typers'),
+}
+
+def count_objects(decoder):
+    return {
+        'instructions': len(decoder.operations),
+        'views': len(decoder.operations.views),
+        'subs': len(decoder.subs),
+        'groups': sum(len(sub.groups) for sub in decoder.subs.values()),
+        'sinks': len(decoder.sinks),
+    }
+
+class GPCPassManager(object):
+    # runs the pipelines of every decoder given this manager, skipping the
+    # disabled passes and whatever depends on them, and with stats on keeps
+    # wall time, calls and the most objects any call left behind per pass;
+    # with more than one job, passes over every sub of a big image may fork
+    # that many workers
+    def __init__(self, disabled=(), stats=False, jobs=1):
+        for name in disabled:
+            if name not in passes:
+                raise ValueError('unknown pass {0}'.format(name))
+        self.disabled = frozenset(disabled)
+        self.stats = {} if stats else None
+        self.order = []
+        self.jobs = jobs
+
+    def run(self, decoder, pipeline):
+        decoder.passes.append(pipeline)
+        for name in pipelines[pipeline]:
+            if name in self.disabled or [d for d in passes[name] if d not in decoder.ran]:
+                self.record(name, None)
+                continue
+            start = time.time()
+            getattr(decoder, name)()
+            decoder.ran.add(name)
+            if self.stats is not None:
+                self.record(name, time.time() - start, count_objects(decoder))
+        decoder.done.append(pipeline)
+
+    def entry(self, name):
+        entry = self.stats.get(name)
+        if entry is None:
+            entry = self.stats[name] = {'calls': 0, 'skipped': 0, 'time': 0.0, 'objects': {}}
+            self.order.append(name)
+        return entry
+
+    def record(self, name, elapsed, objects=None):
+        # elapsed is None for a pass that was skipped
+        if self.stats is None:
+            return
+        entry = self.entry(name)
+        if elapsed is None:
+            entry['skipped'] += 1
+            return
+        entry['calls'] += 1
+        entry['time'] += elapsed
+        for key, count in (objects or {}).items():
+            entry['objects'][key] = max(entry['objects'].get(key, 0), count)
+
+    def report(self):
+        return {'passes': [dict(self.stats[name], name=name) for name in self.order]}
+
+    def merge(self, report):
+        # adds a report from another manager, as gpcbatch workers send back
+        for other in report['passes']:
+            entry = self.entry(other['name'])
+            entry['calls'] += other['calls']
+            entry['skipped'] += other['skipped']
+            entry['time'] += other['time']
+            for key, count in other['objects'].items():
+                entry['objects'][key] = max(entry['objects'].get(key, 0), count)
+
+    def format(self):
+        lines = ['{0:<18} {1:>6} {2:>10}  {3}'.format('pass', 'calls', 'time', 'objects')]
+        for entry in self.report()['passes']:
+            objects = ' '.join('{0}={1}'.format(k, v) for k, v in sorted(entry['objects'].items()))
+            if entry['skipped']:
+                objects = ('skipped={0} '.format(entry['skipped']) + objects).strip()
+            lines.append('{0:<18} {1:>6} {2:>9.4f}s  {3}'.format(entry['name'], entry['calls'], entry['time'], objects))
+        return lines
+
+    def write(self, path=None):
+        # a table on stderr, or the report as json if given a path
+        if not path:
+            for line in self.format():
+                sys.stderr.write(line + '\n')
+            return
+        import json
+        with open(path, 'wb') as f:
+            json.dump(self.report(), f, indent=1, sort_keys=True)
+            f.write('\n')
+
+# used by decoders not given a manager of their own
+default = GPCPassManager()
@@ -0,0 +1,106 @@
+# patterns over the stack expression IR, matched on op names and operands
+# rather than on rendered code, and the combo sites they find
+
+class GPCPattern(object):
+    # a node with one of the op names, a first operand passing the test and
+    # sources matching the patterns in address order, None matches anything
+    def __init__(self, names, operand=None, sources=None):
+        self.names = frozenset((names,) if isinstance(names, str) else names)
+        self.operand = operand
+        self.sources = sources
+
+    def match(self, node):
+        operation = getattr(node, 'operation', None)
+        if operation is None or operation._name not in self.names:
+            return False
+        if self.operand is not None:
+            if not operation.arguments or not self.operand(operation.arguments[0]):
+                return False
+        if self.sources is not None:
+            sources = getattr(node, 'sources', None) or {}
+            if len(sources) != len(self.sources):
+                return False
+            for addr, pattern in zip(sorted(sources), self.sources):
+                if pattern is not None and not pattern.match(sources[addr]):
+                    return False
+        return True
+
+class GPCLeaves(object):
+    # a sink whose leaf sources match the patterns one each, in any order
+    def __init__(self, *patterns):
+        self.patterns = patterns
+
+    def match(self, node):
+        if not hasattr(node, 'all_sources'):
+            return False
+        leaves = node.all_sources()
+        return len(leaves) == len(self.patterns) and assign(leaves, self.patterns)
+
+def assign(leaves, patterns):
+    # backtracks over which leaf each pattern takes, there are only a few
+    if not patterns:
+        return True
+    for i, leaf in enumerate(leaves):
+        if patterns[0].match(leaf) and assign(leaves[:i] + leaves[i + 1:], patterns[1:]):
+            return True
+    return False
+
+def equals(value):
+    return lambda operand: operand == value
+
+def state(k, limit=None):
+    # variable k of the three every combo keeps: running, wait and step,
+    # of one of the first limit / 3 combos if given
+    return lambda var: var % 3 == k and (limit is None or var < limit)
+
+class GPCComboMatcher(object):
+    # the code the compiler generates around combos, for a script with
+    # combo_count of them
+    def __init__(self, combo_count):
+        limit = combo_count * 3
+        number = GPCPattern('pushi')
+        zero = GPCPattern('pushi', equals(0))
+        # combo_run, and combo_stop or combo_restart when the wait and step
+        # are cleared right after
+        self.start = GPCPattern('pop', state(0, limit), [number])
+        self.clear = (GPCPattern('pop', state(1, limit), [zero]), GPCPattern('pop', state(2, limit), [zero]))
+        self.test = GPCPattern('push', state(0, limit))
+        # inside a combo: call(combo) and the wait before the next step
+        self.call = GPCPattern('pop', state(0), [GPCPattern('pushi', equals(1))])
+        self.wait = GPCPattern('pop', state(1), [GPCPattern('mul')])
+        self.number = number
+        self.zero = zero
+        self.machines = {}
+
+    def machine(self, idx):
+        # the state machine of combo idx: testing or stepping its step, and
+        # setting any of its variables to 0
+        machine = self.machines.get(idx)
+        if machine is None:
+            base = idx * 3
+            machine = self.machines[idx] = (
+                GPCLeaves(GPCPattern('push', equals(base + 2)), self.number),
+                GPCPattern('pop', lambda var: base <= var < base + 3, [self.zero]))
+        return machine
+
+    def site(self, group):
+        # ('run', 'stop' or 'restart', combo) if the group starts a combo, the
+        # op names of a pattern turn most groups down before anything else
+        sink = group.final_sink
+        operation = getattr(sink, 'operation', None)
+        if operation is None or operation._name not in self.start.names or not self.start.match(sink):
+            return None
+        combo = operation.arguments[0] / 3
+        second = group.next
+        third = second and second.next
+        if third and self.clear[0].match(second.final_sink) and self.clear[1].match(third.final_sink):
+            value = sink.sources.values()[0].operation.arguments[0]
+            return 'restart' if value == 1 else 'stop', combo
+        return 'run', combo
+
+    def running(self, leaf):
+        # the combo a leaf source tests the running variable of, or None
+        operation = leaf.operation
+        if operation._name not in self.test.names or not self.test.match(leaf):
+            return None
+        return operation.arguments[0] / 3
@@ -0,0 +1,245 @@
+import time
+from gpclib.decode import GPCDecoder, GPCBlock, GPCFlowGraph, is_container
+from gpclib.passes import count_objects
+from gpclib.visit import groups, nodes
+
+
+def asm(decoder):
+    return decoder.disassemble()
+
+def sink_lines(sink, indent, i = 0):
+    # every node one tab further in than the sink it feeds
+    for node, depth in nodes(sink):
+        yield '{0:0>4X}\t\t{1}{2}{3}'.format(node.address, indent, '\t'*(i + depth), node.operation)
+
+def group_line(cfg, group, indent):
+    jumped_from = ''
+    jump_to = ''
+    a = group._jump or group._jumpz or -1
+    if a > 0:
+        jump_to = ' {1}> g_{0:0>4X}'.format(a, '-' if group._jump else '?')
+    # the last jump into the group, unconditional ones first
+    jumped = cfg.jumped_from(group.address, GPCFlowGraph.JUMP)
+    a = jumped or cfg.jumped_from(group.address, GPCFlowGraph.JUMPZ) or -1
+    if a > 0:
+        jumped_from = 'g_{0:0>4X} {1}> '.format(a, '-' if jumped else '?')
+    return '{0:0>4X} \t{3}{2}(g_{0:0>4X}){1}'.format(group.address, jump_to, jumped_from, indent)
+
+def all_subs(decoder):
+    subs = decoder.subs.values()
+    if decoder.init:
+        subs.insert(0, decoder.init)
+    if decoder.start:
+        subs.insert(0, decoder.start)
+    return sorted(subs, key=lambda s: s.address)
+
+def fgrp(decoder):
+    for sub in all_subs(decoder):
+        yield '{0:0>4X} {1}:'.format(sub.address, sub.generate_prototype())
+        for group in sorted(sub.groups.values(), key=lambda g: g.address):
+            yield group_line(sub.cfg, group, '')
+            sink = group.resolve()
+            for line in sink_lines(sink, ''):
+                yield line
+
+def block_lines(cfg, block, i = 0):
+    yield '{0:0>4X} \t{1}b_{0:0>4X}'.format(int(block.address), '\t' * i)
+    for group, depth in groups(block):
+        if isinstance(group, GPCBlock):
+            yield '{0:0>4X} \t{1}b_{0:0>4X}'.format(int(group.address), '\t' * (i + depth))
+        else:
+            yield group_line(cfg, group, '\t' * (i + depth))
+            for line in sink_lines(group.final_sink, '\t\t', i + depth - 1):
+                yield line
+
+def blocks(decoder):
+    for sub in all_subs(decoder):
+        yield '{0:0>4X} {1}:'.format(sub.address, sub.generate_prototype())
+        for line in block_lines(sub.cfg, sub.root):
+            yield line
+
+def c(decoder):
+    # after lazy_decode every sub is resolved right before it is written and
+    # released right after, so only one function is held at a time
+    lazy = 'lazy_decode' in decoder.done
+
+    # decompile the data segment if there is one
+    if decoder.start:
+        yield '// data segment'
+        for line in decoder.start.decompile():
+            yield line
+        yield ''
+
+    # decompile any remaps
+    if decoder.maps:
+        yield '// mapping segment'
+        for line in decoder.maps.decompile(decoder):
+            yield line
+        yield ''
+
+    # initial values of the allocations come from init, a rebuild after a
+    # patch may have done this already
+    if lazy and 'init_decode' not in decoder.done:
+        decoder.init_decode()
+
+    # on a big image a pool of workers resolves and decompiles the functions,
+    # each from its own copy of the decoder, while main is done here
+    from gpclib.parallel import bodies
+    subs = [sub for sub in sorted(decoder.subs.values(), key=lambda s: s.address) if sub.name not in ('init', 'main')]
+    done = lazy and bodies(decoder, subs)
+
+    # decompile any allocations
+    if decoder.allocs:
+        yield '// variable segment'
+        for index,count in sorted(decoder.allocs.items(), key=lambda a: a[0]):
+            if index < decoder.combo_count * 3: continue
+            if count > 1:
+                yield 'int v{0}[{1}];'.format(index, count)
+            else:
+                if decoder.alloc_values.has_key(index):
+                    yield 'int {0};'.format(decoder.alloc_values[index])
+                else:
+                    yield 'int v{0};'.format(index)
+        yield ''
+
+    if decoder.t0:
+        yield '// titan only instruction to prevent operation on cronus'
+        yield '{0};'.format(decoder.t0.final_sink.decompile(decoder))
+        yield ''
+
+    yield '// main segment'
+
+    # decompile init and main
+    for sub in sorted(decoder.subs.values(), key=lambda s: s.address):
+        if sub.name not in ('init', 'main'): continue
+        if lazy:
+            decoder.resolve_sub(sub.address)
+        yield '{0} {{'.format(sub.generate_prototype())
+        for line in sub.decompile():
+            yield '\t{0}'.format(line)
+        yield '}'
+        yield ''
+
+    # decompile combos
+    if decoder.combos:
+        yield '// combo segment'
+        for idx,combo in enumerate(decoder.combos):
+            yield 'combo combo{0} {{'.format(idx)
+            for line in combo.decompile(decoder):
+                yield '\t{0}'.format(line)
+            yield '}'
+            yield ''
+    if lazy and decoder.main:
+        decoder.release_sub(decoder.main)
+
+    # decompile the rest of the subs
+    if subs:
+        yield '// function segment'
+    for sub in subs:
+        if done:
+            lines = next(done)
+        else:
+            if lazy:
+                decoder.resolve_sub(sub.address)
+            lines = sub.decompile()
+        yield '{0} {{'.format(sub.generate_prototype())
+        for line in lines:
+            yield '\t{0}'.format(line)
+        yield '}'
+        yield ''
+        if lazy and not done:
+            decoder.release_sub(sub)
+
+def jsonl(decoder):
+    # the records and json are only loaded for the kind that writes them
+    from gpclib import export
+    return export.jsonl(decoder)
+
+def error_record(error):
+    from gpclib import export
+    return export.error(error)
+
+# output kinds: decoder passes to run, renderer and file extension
+kinds = {
+    'asm': (('full_decode',), asm, '.asm'),
+    'fgrp': (('full_decode',), fgrp, '.fgrp'),
+    'blocks': (('full_decode',), blocks, '.blocks'),
+    'c': (('lazy_decode',), c, '.gpc'),
+    'jsonl': (('lazy_decode',), jsonl, '.jsonl'),
+}
+
+# how kinds that are not plain text write a decode error
+errors = {
+    'jsonl': error_record,
+}
+
+def decode(data, kind, memo=None, manager=None):
+    # a container holds the decode of an earlier run, one that is damaged
+    # raises here as there is nothing to render
+    if is_container(data):
+        from gpclib.container import GPCContainer
+        decoder = GPCContainer(data).decoder(manager)
+    else:
+        decoder = GPCDecoder(data, memo, manager)
+    error = None
+
+    # decode the entire input
+    try:
+        for name in kinds[kind][0]:
+            getattr(decoder, name)()
+    except ValueError as e:
+        error = e
+    return decoder, error
+
+def timed(decoder, name, lines):
+    # the time spent making the lines, not what the consumer does with them
+    elapsed = 0.0
+    lines = iter(lines)
+    while True:
+        start = time.time()
+        try:
+            line = next(lines)
+        except StopIteration:
+            break
+        finally:
+            elapsed += time.time() - start
+        yield line
+    decoder.manager.record(name, elapsed, count_objects(decoder))
+
+def stream(data, kind, decoder, error, cache):
+    writer = cache and cache.writer(data, kind)
+    lines = kinds[kind][1](decoder)
+    if decoder.manager.stats is not None:
+        lines = timed(decoder, 'render_' + kind, lines)
+    try:
+        if error is not None:
+            line = errors[kind](error) if kind in errors else error
+            if writer: writer.write(line)
+            yield line
+        for line in lines:
+            if writer: writer.write(line)
+            yield line
+    except BaseException:
+        # only complete outputs are cached
+        if writer: writer.discard()
+        raise
+    if writer:
+        writer.commit(decoder, error)
+
+def output(data, kind, cache=None, memo=None, manager=None):
+    # returns the ValueError message, if any, and an iterator over the output lines
+    if manager is not None and manager.disabled:
+        # the cache only knows outputs of the whole pipeline
+        cache = None
+    if cache is not None:
+        entry = cache.get(data, kind)
+        if entry is not None:
+            return entry['error'], entry['lines']
+
+    decoder, error = decode(data, kind, memo, manager)
+    if error is not None:
+        error = str(error)
+    return error, stream(data, kind, decoder, error, cache)
+
+def render(data, kind, cache=None, memo=None, manager=None):
+    return output(data, kind, cache, memo, manager)[1]
@@ -0,0 +1,148 @@
+from array import array
+from gpclib.opcodes import dispatch, lengths, load, DataOpCode
+
+# op code column value of a data row
+DATA = -1
+
+class GPCInstructionStore(object):
+    def __init__(self, data):
+        load()
+        self.data = data
+        self.address = array('i')
+        self.opcode = array('h')
+        self.size = array('H')
+        self.operands = (array('i'), array('i'), array('i'))
+        self.pushes = array('B')
+        self.pops = array('B')
+        self.target = array('i')
+        # row of every address, -1 if nothing was decoded there
+        self.rows = array('i', [-1]) * max(0x10000, len(data))
+        # materialized OpCode views by address
+        self.views = {}
+
+    def _store(self, address, opcode, size, arguments, pushes, pops, target):
+        operands = (tuple(arguments[:3]) + (0, 0, 0))[:3]
+        row = self.rows[address]
+        if row < 0:
+            row = self.rows[address] = len(self.address)
+            self.address.append(address)
+            self.opcode.append(opcode)
+            self.size.append(size)
+            self.operands[0].append(operands[0])
+            self.operands[1].append(operands[1])
+            self.operands[2].append(operands[2])
+            self.pushes.append(pushes)
+            self.pops.append(pops)
+            self.target.append(target)
+        else:
+            self.views.pop(address, None)
+            self.opcode[row] = opcode
+            self.size[row] = size
+            self.operands[0][row] = operands[0]
+            self.operands[1][row] = operands[1]
+            self.operands[2][row] = operands[2]
+            self.pushes[row] = pushes
+            self.pops[row] = pops
+            self.target[row] = target
+        return row
+
+    def decode(self, op, address):
+        arguments = ()
+        if op._struct is not None:
+            arguments = op._struct.unpack_from(self.data, address + 1)
+        pushes = op._pushes
+        if op._pushes_argument is not None:
+            pushes = arguments[op._pushes_argument]
+        pops = op._pops
+        if op._pops_argument is not None:
+            pops = arguments[op._pops_argument]
+        target = -1
+        if op._jump or op._call:
+            target = arguments[op._target]
+        if self.rows[address] >= 0:
+            return self._store(address, op._op, lengths[op._op], arguments, pushes, pops, target)
+
+        # fast path for a new row
+        operands = arguments + (0, 0, 0)
+        row = self.rows[address] = len(self.address)
+        self.address.append(address)
+        self.opcode.append(op._op)
+        self.size.append(lengths[op._op])
+        self.operands[0].append(operands[0])
+        self.operands[1].append(operands[1])
+        self.operands[2].append(operands[2])
+        self.pushes.append(pushes)
+        self.pops.append(pops)
+        self.target.append(target)
+        return row
+
+    def materialize(self, addresses):
+        rows = self.rows
+        opcodes = self.opcode
+        operand0, operand1, operand2 = self.operands
+        views = self.views
+        for address in addresses:
+            row = rows[address] if 0 <= address < len(rows) else -1
+            if row < 0:
+                raise KeyError(address)
+            opcode = opcodes[row]
+            if opcode == DATA:
+                o = DataOpCode(self.data, address, self.size[row])
+            else:
+                op = dispatch[opcode]
+                o = op()
+                if op._struct is None:
+                    o.bind(address, None)
+                elif len(op._arguments) > len(self.operands):
+                    o.parse(self.data, address)
+                else:
+                    o.bind(address, (operand0[row], operand1[row], operand2[row])[:len(op._arguments)])
+            views[address] = o
+
+    def operation(self, address):
+        o = self.views.get(address)
+        if o is None:
+            self.materialize((address,))
+            o = self.views[address]
+        return o
+
+    def select(self, addresses):
+        views = self.views
+        missing = [a for a in addresses if a not in views]
+        if missing:
+            self.materialize(missing)
+        return [views[a] for a in addresses]
+
+    def __len__(self):
+        return len(self.address)
+
+    def __iter__(self):
+        return iter(self.address)
+
+    def __contains__(self, address):
+        return 0 <= address < len(self.rows) and self.rows[address] >= 0
+
+    def __getitem__(self, address):
+        return self.operation(address)
+
+    def __setitem__(self, address, op):
+        if isinstance(op, DataOpCode):
+            row = self._store(address, DATA, op.size, (), 0, 0, -1)
+        else:
+            row = self._store(address, op._op, op.size, op.arguments or (), op._pushes, op._pops,
+                getattr(op, 'jump_address', -1))
+        self.views[address] = op
+
+    def get(self, address, default=None):
+        if address not in self:
+            return default
+        return self[address]
+
+    def keys(self):
+        return list(self.address)
+
+    def values(self):
+        return self.select(self.address)
+
+    def items(self):
+        return zip(self.address, self.values())
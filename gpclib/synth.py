@@ -0,0 +1,387 @@
+import random
+import struct
+from gpclib import opcodes as ops
+
+# jump and call targets are 16 bit, statements can run a few hundred bytes
+# past the size asked for so the largest image leaves some room
+max_size = 0xF800
+
+class GPCLabel(object):
+    def __init__(self):
+        self.address = None
+
+class GPCAssembler(object):
+    def __init__(self):
+        self.data = bytearray()
+        self.fixups = []
+
+    @property
+    def address(self):
+        return len(self.data)
+
+    def mark(self, label):
+        label.address = len(self.data)
+        return label
+
+    def emit(self, op, *args):
+        fmt = '<B' + ''.join(op._arguments or ())
+        values = list(args)
+        values.extend([0] * (len(op._arguments or ()) - len(values)))
+        if values and isinstance(values[0], GPCLabel):
+            self.fixups.append((len(self.data) + 1, values[0]))
+            values[0] = 0
+        self.data.extend(struct.pack(fmt, op._op, *values))
+
+    def raw(self, data):
+        self.data.extend(data)
+
+    def assemble(self):
+        if len(self.data) > 0x10000:
+            raise ValueError('Assemble Error: {0} bytes do not fit the address space'.format(len(self.data)))
+        for offset, label in self.fixups:
+            struct.pack_into('<H', self.data, offset, label.address)
+        return bytes(self.data)
+
+class GPCFunction(object):
+    def __init__(self, args, returns):
+        self.label = GPCLabel()
+        self.args = args
+        self.returns = returns
+
+# op codes the generator picks from
+ops.load()
+binary = (ops.AndOpCode, ops.OrOpCode, ops.EqualOpCode, ops.NotEqualOpCode,
+          ops.LessThanOpCode, ops.LessThanEqualOpCode, ops.GreaterThanOpCode,
+          ops.GreaterThanEqualOpCode, ops.AddOpCode, ops.SubtractOpCode,
+          ops.MultiplyOpCode, ops.DivideOpCode, ops.ModulusOpCode, ops.XorOpCode)
+unary = (ops.NotOpCode, ops.AbsOpCode, ops.InverseOpCode, ops.IntSqrtOpCode)
+buttons = (ops.GetValOpCode, ops.GetLvalOpCode, ops.GetPtimeOpCode,
+           ops.EventPressOpCode, ops.EventReleaseOpCode)
+nullary = (ops.GetRtimeOpCode, ops.GetConsoleOpCode, ops.GetControllerOpCode,
+           ops.GetSlotOpCode, ops.GetBatteryOpCode)
+comparisons = (ops.EqualOpCode, ops.NotEqualOpCode, ops.LessThanOpCode,
+               ops.GreaterThanOpCode)
+statements = (ops.ResetLedOpCode, ops.BlockRumbleOpCode, ops.ResetRumbleOpCode)
+
+class GPCGenerator(object):
+    # valid bytecode of about size bytes, the same for the same arguments:
+    # nested if/else/while, subs with arguments and return values, allocs,
+    # remaps, init values, combos and optionally a data segment
+    def __init__(self, seed=0, size=4096, combos=0, data=0):
+        self.random = random.Random(seed)
+        self.size = min(size, max_size)
+        self.combo_count = combos
+        self.data_size = data
+        self.asm = GPCAssembler()
+        self.scalars = []
+        self.arrays = []
+        self.functions = []
+        self.function = None
+        self.loops = []
+
+    def generate(self):
+        r = self.random
+        asm = self.asm
+        for i in range(max(1, self.size // 512)):
+            self.functions.append(GPCFunction(r.randint(0, 3), r.random() < 0.5))
+
+        # data segment
+        init = GPCLabel()
+        if self.data_size:
+            asm.emit(ops.JumpOpCode, init)
+            # data bytes come from their own stream so the code is the same
+            # for any data size, only moved
+            fill = random.Random(self.data_size)
+            asm.raw(bytearray(fill.randint(0, 255) for i in range(self.data_size)))
+        asm.mark(init)
+
+        # variable segment
+        total = 0
+        if self.combo_count:
+            asm.emit(ops.AllocateOpCode, self.combo_count * 3)
+            total = self.combo_count * 3
+        for i in range(r.randint(3, 8)):
+            asm.emit(ops.AllocateOpCode, 1)
+            self.scalars.append(total)
+            total += 1
+        for i in range(r.randint(1, 3)):
+            count = r.randint(2, 10)
+            asm.emit(ops.AllocateOpCode, count)
+            self.arrays.append(total)
+            total += count
+        for i in range(r.randint(0, 3)):
+            asm.emit(ops.RemapOpCode, r.randint(0, 20), r.randint(0, 20))
+        for var in r.sample(self.scalars, r.randint(0, len(self.scalars))):
+            asm.emit(ops.PushImmediateOpCode, r.randint(0, 20))
+            asm.emit(ops.PopOpCode, var)
+        if r.random() < 0.3:
+            asm.emit(ops.NopOpCode)
+        if r.random() < 0.3:
+            self.block(2, 2)
+            self.statement(0)
+
+        # main segment
+        asm.emit(ops.MainStartOpCode)
+        main_end = self.size // 2
+        while asm.address < main_end:
+            self.statement(3)
+        for idx in range(self.combo_count):
+            self.combo(idx)
+        asm.emit(ops.MainEndOpCode)
+
+        # function segment
+        for function in self.functions:
+            self.function = function
+            asm.mark(function.label)
+            end = asm.address + max(32, (self.size - asm.address) // max(1, len(self.functions) - self.functions.index(function)))
+            while asm.address < end:
+                self.statement(3)
+            if function.returns:
+                self.expression(2)
+                asm.emit(ops.RetOpCode, 1)
+            else:
+                asm.emit(ops.RetOpCode, 0)
+        return asm.assemble()
+
+    def shape(self, kind, count):
+        # main is a single else if chain of count arms, count nested ifs or
+        # count nested whiles, to time how structuring scales with them
+        asm = self.asm
+        asm.emit(ops.AllocateOpCode, 1)
+        self.scalars.append(0)
+        asm.emit(ops.AllocateOpCode, 4)
+        self.arrays.append(1)
+        asm.emit(ops.MainStartOpCode)
+        if kind == 'elseif':
+            end = GPCLabel()
+            for i in range(count):
+                other = GPCLabel()
+                self.condition()
+                asm.emit(ops.JumpZeroOpCode, other)
+                self.statement(0)
+                if i < count - 1:
+                    asm.emit(ops.JumpOpCode, end)
+                asm.mark(other)
+            asm.mark(end)
+        elif kind in ('if', 'while'):
+            tops = []
+            ends = []
+            for i in range(count):
+                tops.append(asm.mark(GPCLabel()))
+                ends.append(GPCLabel())
+                self.condition()
+                asm.emit(ops.JumpZeroOpCode, ends[-1])
+                self.statement(0)
+            for top, end in reversed(zip(tops, ends)):
+                self.statement(0)
+                if kind == 'while':
+                    asm.emit(ops.JumpOpCode, top)
+                asm.mark(end)
+        else:
+            raise ValueError('unknown shape {0}'.format(kind))
+        asm.emit(ops.MainEndOpCode)
+        return asm.assemble()
+
+    def expression(self, depth):
+        r = self.random
+        asm = self.asm
+        choice = r.randint(0, 9 if depth > 0 else 3)
+        if choice == 0:
+            asm.emit(ops.PushImmediateOpCode, r.randint(-100, 1000))
+        elif choice == 1:
+            asm.emit(ops.PushOpCode, r.choice(self.scalars))
+        elif choice == 2:
+            if self.function and self.function.args:
+                asm.emit(ops.PushArgumentOpCode, r.randint(0, self.function.args - 1))
+            elif self.combo_count:
+                asm.emit(ops.PushOpCode, r.randint(0, self.combo_count - 1) * 3)
+            else:
+                asm.emit(ops.PushImmediateOpCode, r.randint(0, 1))
+        elif choice == 3:
+            asm.emit(r.choice(nullary))
+        elif choice in (4, 5):
+            self.expression(depth - 1)
+            self.expression(depth - 1)
+            asm.emit(r.choice(binary))
+        elif choice == 6:
+            self.expression(depth - 1)
+            asm.emit(r.choice(unary))
+        elif choice == 7:
+            asm.emit(ops.PushImmediateOpCode, r.randint(0, 35))
+            asm.emit(r.choice(buttons))
+        elif choice == 8:
+            self.expression(depth - 1)
+            asm.emit(ops.PushIndexedOpCode, r.choice(self.arrays))
+        else:
+            functions = [f for f in self.functions if f.returns]
+            if not functions:
+                return self.expression(depth - 1)
+            function = r.choice(functions)
+            for i in range(function.args):
+                self.expression(depth - 1)
+            asm.emit(ops.CallOpCode, function.label, function.args, 1)
+
+    def condition(self):
+        self.expression(1)
+        self.expression(1)
+        self.asm.emit(self.random.choice(comparisons))
+
+    def block(self, depth, count):
+        for i in range(count):
+            self.statement(depth)
+
+    def statement(self, depth):
+        r = self.random
+        asm = self.asm
+        choice = r.randint(0, 14 if depth > 0 else 9)
+        if choice in (0, 1):
+            self.expression(2)
+            asm.emit(ops.PopOpCode, r.choice(self.scalars))
+        elif choice == 2:
+            self.expression(1)
+            self.expression(2)
+            asm.emit(ops.PopIndexedOpCode, r.choice(self.arrays))
+        elif choice == 3:
+            asm.emit(ops.PushImmediateOpCode, r.randint(0, 35))
+            self.expression(2)
+            asm.emit(ops.SetValOpCode)
+        elif choice == 4:
+            self.expression(1)
+            asm.emit(ops.WaitOpCode)
+        elif choice == 5:
+            asm.emit(ops.PushImmediateOpCode, r.randint(0, 3))
+            self.expression(1)
+            asm.emit(r.choice((ops.SetLedOpCode, ops.SetRumbleOpCode)))
+        elif choice == 6:
+            asm.emit(r.choice(statements))
+        elif choice == 7:
+            if self.function and self.function.args:
+                self.expression(2)
+                asm.emit(ops.PopArgumentOpCode, r.randint(0, self.function.args - 1))
+            else:
+                asm.emit(ops.PushImmediateOpCode, r.randint(0, 35))
+                asm.emit(ops.PushImmediateOpCode, r.randint(0, 35))
+                asm.emit(ops.SwapOpCode)
+        elif choice == 8:
+            functions = [f for f in self.functions if not f.returns]
+            if not functions:
+                return self.statement(depth)
+            function = r.choice(functions)
+            for i in range(function.args):
+                self.expression(1)
+            asm.emit(ops.CallOpCode, function.label, function.args, 0)
+        elif choice == 9:
+            if not self.combo_count:
+                return self.statement(depth)
+            index = r.randint(0, self.combo_count - 1) * 3
+            kind = r.randint(0, 2)
+            asm.emit(ops.PushImmediateOpCode, 0 if kind == 1 else 1)
+            asm.emit(ops.PopOpCode, index)
+            if kind:
+                asm.emit(ops.PushImmediateOpCode, 0)
+                asm.emit(ops.PopOpCode, index + 1)
+                asm.emit(ops.PushImmediateOpCode, 0)
+                asm.emit(ops.PopOpCode, index + 2)
+        elif choice in (10, 11):
+            # if
+            end = GPCLabel()
+            self.condition()
+            asm.emit(ops.JumpZeroOpCode, end)
+            self.block(depth - 1, r.randint(1, 3))
+            if self.loops and r.random() < 0.3:
+                asm.emit(ops.JumpOpCode, self.loops[-1])
+            asm.mark(end)
+        elif choice == 12:
+            # if / else if / else
+            end = GPCLabel()
+            if r.random() < 0.5:
+                other = GPCLabel()
+                self.condition()
+                asm.emit(ops.JumpZeroOpCode, other)
+                self.block(depth - 1, r.randint(1, 3))
+                asm.emit(ops.JumpOpCode, end)
+                asm.mark(other)
+                self.statement(0)
+                self.block(depth - 1, r.randint(0, 1))
+            else:
+                arms = r.randint(2, 4)
+                for i in range(arms):
+                    other = end if i == arms - 1 else GPCLabel()
+                    self.condition()
+                    asm.emit(ops.JumpZeroOpCode, other)
+                    self.block(depth - 1, r.randint(1, 3))
+                    if other is not end:
+                        asm.emit(ops.JumpOpCode, end)
+                        asm.mark(other)
+            asm.mark(end)
+        elif choice == 13:
+            # while
+            top = GPCLabel()
+            end = GPCLabel()
+            asm.mark(top)
+            self.condition()
+            asm.emit(ops.JumpZeroOpCode, end)
+            self.loops.append(end)
+            self.block(depth - 1, r.randint(1, 3))
+            self.loops.pop()
+            asm.emit(ops.JumpOpCode, top)
+            asm.mark(end)
+        else:
+            self.block(depth - 1, r.randint(1, 4))
+
+    def combo(self, idx):
+        r = self.random
+        asm = self.asm
+        base = idx * 3
+        end = GPCLabel()
+        asm.emit(ops.PushOpCode, base)
+        asm.emit(ops.JumpZeroOpCode, end)
+
+        # wait counter
+        skip = GPCLabel()
+        asm.emit(ops.PushOpCode, base + 1)
+        asm.emit(ops.PushImmediateOpCode, 0)
+        asm.emit(ops.GreaterThanOpCode)
+        asm.emit(ops.JumpZeroOpCode, skip)
+        asm.emit(ops.PushOpCode, base + 1)
+        asm.emit(ops.GetRtimeOpCode)
+        asm.emit(ops.SubtractOpCode)
+        asm.emit(ops.PopOpCode, base + 1)
+        asm.mark(skip)
+        skip = GPCLabel()
+        asm.emit(ops.PushOpCode, base + 1)
+        asm.emit(ops.PushImmediateOpCode, 0)
+        asm.emit(ops.LessThanEqualOpCode)
+        asm.emit(ops.JumpZeroOpCode, skip)
+        asm.emit(ops.PushImmediateOpCode, 1)
+        asm.emit(ops.PopOpCode, base + 1)
+        asm.mark(skip)
+
+        # steps
+        steps = r.randint(1, 4)
+        for step in range(steps):
+            skip = GPCLabel()
+            asm.emit(ops.PushOpCode, base + 2)
+            asm.emit(ops.PushImmediateOpCode, step)
+            asm.emit(ops.EqualOpCode)
+            asm.emit(ops.JumpZeroOpCode, skip)
+            for i in range(r.randint(1, 3)):
+                asm.emit(ops.PushImmediateOpCode, r.randint(0, 35))
+                asm.emit(ops.PushImmediateOpCode, r.randint(-100, 100))
+                asm.emit(ops.SetValOpCode)
+            if r.random() < 0.3:
+                asm.emit(ops.PushImmediateOpCode, 1)
+                asm.emit(ops.PopOpCode, r.randint(0, self.combo_count - 1) * 3)
+            asm.emit(ops.PushImmediateOpCode, r.randint(10, 400))
+            asm.emit(ops.PushImmediateOpCode, 1)
+            asm.emit(ops.MultiplyOpCode)
+            asm.emit(ops.PopOpCode, base + 1)
+            asm.emit(ops.PushOpCode, base + 2)
+            asm.emit(ops.PushImmediateOpCode, 1)
+            asm.emit(ops.AddOpCode)
+            asm.emit(ops.PopOpCode, base + 2)
+            if step == steps - 1:
+                asm.emit(ops.PushImmediateOpCode, 0)
+                asm.emit(ops.PopOpCode, base)
+            asm.mark(skip)
+        asm.mark(end)
@@ -0,0 +1,92 @@
+# iterative walks over trees of blocks and functional groups and over the
+# stack nodes under a sink, and a rewriter running several rules in one walk;
+# nothing here recurses so nesting depth is only bounded by memory
+
+def is_block(node):
+    # blocks hold groups, functional groups and stack nodes do not
+    return getattr(node, 'groups', None) is not None
+
+def by_address(groups):
+    return iter(sorted(groups.values(), key=lambda g: g.address))
+
+def groups(block):
+    # (group, depth) for every group and block under block, in address order,
+    # each block right before what it holds
+    stack = [(by_address(block.groups), 1)]
+    while stack:
+        items, depth = stack[-1]
+        group = next(items, None)
+        if group is None:
+            stack.pop()
+            continue
+        yield group, depth
+        if is_block(group):
+            stack.append((by_address(group.groups), depth + 1))
+
+def nodes(sink, ordered=True):
+    # (node, depth) for sink and every node under it, sources before the sink
+    # they feed and, if ordered, in address order
+    if not hasattr(sink, 'sources'):
+        yield sink, 0
+        return
+    stack = [(sink, 0, sources(sink, ordered))]
+    while stack:
+        node, depth, items = stack[-1]
+        source = next(items, None)
+        if source is None:
+            stack.pop()
+            yield node, depth
+        elif hasattr(source, 'sources'):
+            stack.append((source, depth + 1, sources(source, ordered)))
+        else:
+            yield source, depth + 1
+
+def leaves(sink):
+    # the leaves under sink in no particular order, cheaper than nodes when
+    # the shape of the expression does not matter
+    if not hasattr(sink, 'sources'):
+        return []
+    found = []
+    pending = [sink]
+    while pending:
+        for source in pending.pop().sources.itervalues():
+            if hasattr(source, 'sources'):
+                pending.append(source)
+            else:
+                found.append(source)
+    return found
+
+def sources(sink, ordered):
+    if ordered:
+        return iter([sink.sources[addr] for addr in sorted(sink.sources)])
+    return iter(sink.sources.values())
+
+class GPCRewriter(object):
+    # runs rules over trees of blocks in one walk: every rule with a group
+    # method sees each functional group in address order and may replace its
+    # final sink, then every rule with a leaf method sees each leaf under the
+    # final sink the group ends up with
+    def __init__(self, rules):
+        self.rules = rules
+        self.group_rules = [rule.group for rule in rules if hasattr(rule, 'group')]
+        self.leaf_rules = [rule.leaf for rule in rules if hasattr(rule, 'leaf')]
+
+    def run(self, *blocks):
+        # groups inlined and without the depths, this is the hot loop of
+        # every rewrite pass
+        group_rules, leaf_rules = self.group_rules, self.leaf_rules
+        stack = [by_address(block.groups) for block in reversed(blocks)]
+        while stack:
+            group = next(stack[-1], None)
+            if group is None:
+                stack.pop()
+            elif is_block(group):
+                stack.append(by_address(group.groups))
+            else:
+                for rule in group_rules:
+                    rule(group)
+                if leaf_rules:
+                    for leaf in leaves(group.final_sink):
+                        for rule in leaf_rules:
+                            rule(leaf)
+        return self
@@ -0,0 +1,21 @@
+import unittest
+from gpclib.container import dump
+from gpclib.render import output
+from gpclib.synth import GPCGenerator
+
+class GPCContainerTest(unittest.TestCase):
+    # a container renders what the image it was made from does, whatever
+    # buffer type either comes in
+    def test_buffers(self):
+        image = GPCGenerator(6, 4000, 2, 16).generate()
+        container = dump(image)
+        for kind in ('asm', 'blocks', 'c'):
+            want = list(output(image, kind)[1])
+            for wrap in (str, bytearray, buffer, memoryview):
+                self.assertEqual(dump(wrap(image)), container, wrap.__name__)
+                error, lines = output(wrap(container), kind)
+                self.assertIsNone(error)
+                self.assertEqual(list(lines), want, '{0} {1}'.format(kind, wrap.__name__))
+
+if __name__ == '__main__':
+    unittest.main()
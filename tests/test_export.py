@@ -0,0 +1,39 @@
+import json
+import unittest
+from gpclib.decode import GPCDecoder
+from gpclib.render import output
+from gpclib.synth import GPCGenerator
+
+class GPCExportTest(unittest.TestCase):
+    # every buffer type an image can come in exports the same records
+    def test_buffers(self):
+        image = GPCGenerator(4, 4000, 2, 16).generate()
+        want = list(output(image, 'jsonl')[1])
+        self.assertTrue([line for line in want if '"op":"data"' in line])
+        for wrap in (bytearray, buffer, memoryview):
+            error, lines = output(wrap(image), 'jsonl')
+            self.assertIsNone(error)
+            self.assertEqual(list(lines), want, wrap.__name__)
+
+    # a sub that fails to resolve becomes an error record, the rest follow
+    def test_sub_error(self):
+        image = GPCGenerator(5, 4000, 2, 16).generate()
+        want = [json.loads(line) for line in output(image, 'jsonl')[1]]
+        subs = [r['address'] for r in want if r['type'] == 'sub' and r['name'] not in ('init', 'main')]
+        bad = subs[len(subs) // 2]
+        resolve_sub = GPCDecoder.resolve_sub
+        def failing(decoder, address):
+            if address == bad:
+                raise ValueError('bad sub')
+            return resolve_sub(decoder, address)
+        GPCDecoder.resolve_sub = failing
+        try:
+            got = [json.loads(line) for line in output(image, 'jsonl')[1]]
+        finally:
+            GPCDecoder.resolve_sub = resolve_sub
+        self.assertIn({'type': 'error', 'sub': bad, 'message': 'bad sub'}, got)
+        keep = [r for r in want if r.get('sub') != bad and not (r['type'] == 'sub' and r['address'] == bad)]
+        self.assertEqual([r for r in got if r['type'] != 'error'], keep)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import random
+import unittest
+from gpclib.decode import GPCDecoder
+from gpclib.render import kinds
+from gpclib.store import DATA
+from gpclib.synth import GPCGenerator
+
+# (seed, size, combos, data) of the images patched
+images = ((1, 2000, 0, 0), (2, 4000, 2, 16), (3, 8000, 4, 16))
+
+# random patches per image and kind
+patches = 10
+
+def run(decoder, kind, action):
+    # the decode error, or the type of anything else raised, and the lines
+    try:
+        action()
+        error = None
+    except ValueError as e:
+        error = str(e)
+    except Exception as e:
+        error = type(e).__name__
+    try:
+        return error, list(kinds[kind][1](decoder))
+    except Exception as e:
+        return error, type(e).__name__
+
+def decode(decoder, kind):
+    passes = kinds[kind][0]
+    return lambda: [getattr(decoder, name)() for name in passes]
+
+class GPCPatchTest(unittest.TestCase):
+    # a patched decoder renders what a fresh decode of the patched bytes does
+    def check(self, kind):
+        r = random.Random(kind)
+        for seed, size, combos, data in images:
+            image = GPCGenerator(seed, size, combos, data).generate()
+            decoder = None
+            for n in range(patches):
+                if decoder is None:
+                    decoder = GPCDecoder(image)
+                    error, lines = run(decoder, kind, decode(decoder, kind))
+                    self.assertIsNone(error)
+                # mostly inside an operand or data run, sometimes anywhere
+                store = decoder.operations
+                address = r.choice(store.address)
+                row = store.rows[address]
+                length = store.size[row]
+                if r.random() < 0.8 and length > 1:
+                    offset = address + (0 if store.opcode[row] == DATA else 1) + r.randrange(length - 1)
+                else:
+                    offset = r.randrange(len(image))
+                new = bytearray(r.randint(0, 255) for i in range(r.randint(1, 2)))[:len(image) - offset]
+
+                got = run(decoder, kind, lambda: decoder.patch(offset, new))
+                fresh = GPCDecoder(str(decoder.data))
+                action = decode(fresh, kind)
+                if 'lazy_decode' in kinds[kind][0]:
+                    # a patched lazy decoder has set up init already
+                    action = lambda: (decode(fresh, kind)(), fresh.init_decode())
+                want = run(fresh, kind, action)
+                self.assertEqual(got, want, 'seed {0} patch {1:0>4X} {2!r}'.format(seed, offset, str(new)))
+                if got[0]:
+                    # nothing more to patch once the decode failed, start
+                    # over from the image
+                    decoder = None
+
+    def test_asm(self):
+        self.check('asm')
+
+    def test_fgrp(self):
+        self.check('fgrp')
+
+    def test_blocks(self):
+        self.check('blocks')
+
+    def test_c(self):
+        self.check('c')
+
+if __name__ == '__main__':
+    unittest.main()